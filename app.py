@@ -45,6 +45,7 @@ lambda_functions = {
     "etl": etl_stack.etl_lambda_function,
     "train_ml": train_ml_stack.train_ml_lambda_function,
     "predict": predict_stack.predict_lambda_function,
+    "snapshot": predict_stack.snapshot_lambda_function,
 }
 
 codebuild_stack = CodeBuildStack(
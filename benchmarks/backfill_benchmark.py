@@ -0,0 +1,79 @@
+"""Times a backfill of the extraction flow (one mapped task per season) against
+the local stand-in, with each flow executor.
+
+    python benchmarks/backfill_benchmark.py --seasons 5 --latency 0.05 \
+        --executors local threads
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "functions", "ETL"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "functions"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from config import config  # noqa: E402
+from etl import create_executor, extract_games  # noqa: E402
+from fake_api import FakeAPI  # noqa: E402
+from prefect import Flow  # noqa: E402
+from scripts import fetch  # noqa: E402
+from synthetic import generate_games  # noqa: E402
+
+
+def run_backfill(api_url: str, start_date: str, executor: str, workers: int) -> tuple:
+    config.FLOW_EXECUTOR = executor
+    config.FLOW_WORKERS = workers
+    # Fresh fetcher without cache, so every run sends the same requests
+    fetch._fetcher = fetch.PageFetcher(
+        base_url=api_url, requests_per_minute=60_000, backoff_seconds=0.01
+    )
+
+    with Flow(name="backfill_benchmark", executor=create_executor()) as flow:
+        games_data = extract_games(start_date=start_date, incremental=False)
+    start = time.perf_counter()
+    state = flow.run()
+    elapsed = time.perf_counter() - start
+    if not state.is_successful():
+        raise RuntimeError(f"Backfill failed: {state}")
+    games_file = state.result[games_data].result
+    n_games = sum(len(page) for page in games_file)
+    return elapsed, n_games
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seasons", type=int, default=5)
+    parser.add_argument("--teams", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--executors", nargs="+", default=["local", "threads"])
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    config.SPOOL_DIR = tempfile.mkdtemp(prefix="backfill_benchmark_")
+    games = generate_games(seasons=args.seasons, teams=args.teams)
+    start_date = games[0]["date"][:10]
+
+    with FakeAPI(games, latency=args.latency) as api:
+        # Read by the tasks run in worker processes, which import config afresh
+        os.environ.update(
+            BASE_NBA_URL=api.url,
+            FETCH_REQUESTS_PER_MINUTE="60000",
+            RESPONSE_CACHE="none",
+        )
+        baseline = None
+        print(f"{'executor':>10} {'games':>8} {'requests':>9} {'time':>8} {'speedup':>8}")
+        for executor in args.executors:
+            api.requests = 0
+            elapsed, n_games = run_backfill(api.url, start_date, executor, args.workers)
+            assert n_games == len(games), (n_games, len(games))
+            baseline = baseline or elapsed
+            print(
+                f"{executor:>10} {n_games:>8} {api.requests:>9} {elapsed:>7.2f}s "
+                f"{baseline / elapsed:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Local stand-in for the balldontlie games endpoint.
+
+Serves a generated list of games with the same pagination and filters the ETL
+uses (`start_date`, `end_date`, `game_ids[]`, `per_page`, `page`), with an
+optional per-request latency and a rate of transient 503 responses, or a
+number of first requests answered with a 503.
+"""
+import json
+import math
+import random
+import threading
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+
+TEAMS = ["ATL", "BOS", "BKN", "CHA", "CHI", "CLE", "DAL", "DEN", "DET", "GSW"]
+
+
+def make_team(abbreviation: str) -> Dict[str, any]:
+    team_id = TEAMS.index(abbreviation) + 1
+    return {
+        "id": team_id,
+        "abbreviation": abbreviation,
+        "city": f"City {team_id}",
+        "conference": "East" if team_id % 2 else "West",
+        "division": f"Division {team_id % 6}",
+        "full_name": f"City {team_id} Team {team_id}",
+        "name": f"Team {team_id}",
+    }
+
+
+def make_games(n_games: int, start: date = date(2020, 1, 1)) -> List[Dict[str, any]]:
+    """Games shaped like balldontlie's, five per day, all final."""
+    rng = random.Random(0)
+    games = []
+    for game_id in range(1, n_games + 1):
+        home, visitor = rng.sample(TEAMS, 2)
+        game_date = start + timedelta(days=game_id // 5)
+        games.append(
+            {
+                "id": game_id,
+                "date": f"{game_date.isoformat()}T00:00:00.000Z",
+                "home_team": make_team(home),
+                "home_team_score": rng.randint(80, 130),
+                "period": 4,
+                "postseason": False,
+                "season": game_date.year if game_date.month >= 10 else game_date.year - 1,
+                "status": "Final",
+                "time": "Final",
+                "visitor_team": make_team(visitor),
+                "visitor_team_score": rng.randint(80, 130),
+            }
+        )
+    return games
+
+
+def normalize_date(value: str) -> str:
+    if "/" in value:
+        month, day, year = value.split("/")
+        return f"{year}-{month}-{day}"
+    return value
+
+
+class FakeAPI:
+    def __init__(
+        self, games, latency: float = 0.0, failure_rate: float = 0.0, fail_first: int = 0
+    ):
+        self.games = games
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.fail_first = fail_first
+        self.requests = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.make_handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}/api/v1/games"
+
+    def select(self, query: Dict[str, List[str]]) -> List[Dict[str, any]]:
+        games = self.games
+        if "game_ids[]" in query:
+            ids = {int(game_id) for game_id in query["game_ids[]"]}
+            games = [game for game in games if game["id"] in ids]
+        if "start_date" in query:
+            start = normalize_date(query["start_date"][0])
+            games = [game for game in games if game["date"][:10] >= start]
+        if "end_date" in query:
+            end = normalize_date(query["end_date"][0])
+            games = [game for game in games if game["date"][:10] <= end]
+        return games
+
+    def make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with api.lock:
+                    api.requests += 1
+                    fail = (
+                        api.requests <= api.fail_first
+                        or random.random() < api.failure_rate
+                    )
+                    api.failures += fail
+                if api.latency:
+                    threading.Event().wait(api.latency)
+                if fail:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+
+                query = parse_qs(urlparse(self.path).query)
+                games = api.select(query)
+                per_page = int(query.get("per_page", ["25"])[0])
+                page = max(1, int(query.get("page", ["1"])[0]))
+                total_pages = max(1, math.ceil(len(games) / per_page))
+                body = json.dumps(
+                    {
+                        "data": games[(page - 1) * per_page : page * per_page],
+                        "meta": {
+                            "total_pages": total_pages,
+                            "current_page": page,
+                            "next_page": page + 1 if page < total_pages else None,
+                            "per_page": per_page,
+                            "total_count": len(games),
+                        },
+                    }
+                ).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,48 @@
+"""Compares sequential and concurrent page fetching against the local stand-in.
+
+    python benchmarks/fetch_benchmark.py --games 5000 --latency 0.05
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "functions", "ETL"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "functions"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_api import FakeAPI, make_games  # noqa: E402
+from scripts.fetch import PageFetcher  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=5000)
+    parser.add_argument("--per-page", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    games = make_games(args.games)
+    with FakeAPI(games, latency=args.latency, failure_rate=args.failure_rate) as api:
+        for workers in args.workers:
+            fetcher = PageFetcher(
+                base_url=api.url,
+                workers=workers,
+                requests_per_minute=60_000,
+                backoff_seconds=0.01,
+            )
+            api.requests = api.failures = 0
+            start = time.perf_counter()
+            fetched = fetcher.fetch_all({"start_date": "01/01/2020", "per_page": args.per_page})
+            elapsed = time.perf_counter() - start
+            assert [game["id"] for game in fetched] == [game["id"] for game in games]
+            print(
+                f"workers={workers:<3} pages={len(games) // args.per_page:<5} "
+                f"requests={api.requests:<5} retried={api.failures:<4} {elapsed:.2f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Compares flattening every game (flatten_dict + DataFrame + pre_select_features)
+with the columnar builder that only visits the pre-selected paths.
+
+Pages of a pool of generated games are cycled until the requested number of
+games has been converted, so 1M games don't need 1M dicts in memory.
+
+    python benchmarks/flatten_benchmark.py --games 10000 100000 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "functions", "ETL"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "functions"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pandas as pd  # noqa: E402
+from fake_api import make_games  # noqa: E402
+from scripts.transform import (  # noqa: E402
+    feature_paths,
+    flatten_dict,
+    page_to_columns,
+    pre_select_features,
+)
+
+
+def iter_pages(pool, n_games, page_size):
+    converted = 0
+    while converted < n_games:
+        for start in range(0, len(pool), page_size):
+            page = pool[start : start + min(page_size, n_games - converted)]
+            converted += len(page)
+            yield page
+            if converted >= n_games:
+                return
+
+
+def flatten_path(pages):
+    for games in pages:
+        pre_select_features(pd.DataFrame([flatten_dict(game) for game in games]))
+
+
+def columnar_path(pages):
+    paths = None
+    for games in pages:
+        paths = paths or feature_paths(games[0])
+        page_to_columns(games, paths)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--pool", type=int, default=10_000)
+    args = parser.parse_args()
+
+    pool = make_games(args.pool)
+    print(f"{'games':>9} {'flatten_dict':>13} {'columnar':>10} {'speedup':>8}")
+    for n_games in args.games:
+        timings = []
+        for path in (flatten_path, columnar_path):
+            start = time.perf_counter()
+            path(iter_pages(pool, n_games, args.page_size))
+            timings.append(time.perf_counter() - start)
+        print(
+            f"{n_games:>9} {timings[0]:>12.2f}s {timings[1]:>9.2f}s "
+            f"{timings[0] / timings[1]:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
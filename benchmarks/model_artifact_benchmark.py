@@ -0,0 +1,89 @@
+"""Compares the pickled forest with its compact artifact, gzipped and plain:
+stored size, load time from local storage and prediction time, for forests of
+growing size fitted on synthetic features.
+
+    python benchmarks/model_artifact_benchmark.py --trees 100 500 1000 --max-depth 30
+"""
+import argparse
+import gzip
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "functions"))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from common.forest import load_forest, serialize_forest  # noqa: E402
+from common.storage import LocalStorage  # noqa: E402
+from sklearn.ensemble import RandomForestRegressor  # noqa: E402
+
+FEATURES = [f"feature_{i}" for i in range(8)]
+TARGETS = ["home_team_score", "away_team_score"]
+
+
+def best_of(repeat: int, function) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trees", type=int, nargs="+", default=[100, 500, 1000])
+    parser.add_argument("--max-depth", type=int, default=30)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--predict-rows", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(110, 8, (args.rows, len(FEATURES))), columns=FEATURES)
+    y = pd.DataFrame(
+        {
+            "home_team_score": X["feature_0"] + rng.normal(0, 10, args.rows),
+            "away_team_score": X["feature_2"] + rng.normal(0, 10, args.rows),
+        }
+    )
+    X_new = X.sample(args.predict_rows, random_state=0)
+    storage = LocalStorage(tempfile.mkdtemp(prefix="model_artifact_benchmark_"))
+
+    print(
+        f"{'trees':>6} {'artifact':>14} {'size':>10} {'load':>9} {'predict':>9}"
+    )
+    for n_trees in args.trees:
+        model = RandomForestRegressor(
+            n_estimators=n_trees, max_depth=args.max_depth, random_state=0, n_jobs=-1
+        ).fit(X, y)
+        compact = serialize_forest(model, FEATURES, TARGETS)
+        storage.put("model.pkl", pickle.dumps(model))
+        storage.put("model.forest.gz", gzip.compress(compact), content_encoding="gzip")
+        storage.put("model.forest", compact)
+
+        loaders = {
+            "pickle": ("model.pkl", lambda stored: pickle.loads(stored.body)),
+            "forest (gzip)": (
+                "model.forest.gz",
+                lambda stored: load_forest(stored.body, stored.content_encoding),
+            ),
+            "forest": ("model.forest", lambda stored: load_forest(stored.body)),
+        }
+        expected = model.predict(X_new)
+        for name, (key, loader) in loaders.items():
+            loaded = loader(storage.get(key))
+            assert np.array_equal(loaded.predict(X_new), expected), name
+            load_time = best_of(args.repeat, lambda: loader(storage.get(key)))
+            predict_time = best_of(args.repeat, lambda: loaded.predict(X_new))
+            print(
+                f"{n_trees:>6} {name:>14} {storage.head(key).size / 2**20:>8.1f}MB "
+                f"{load_time:>8.4f}s {predict_time:>8.4f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
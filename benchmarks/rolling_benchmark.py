@@ -0,0 +1,71 @@
+"""Compares the per-window groupby/rolling lambdas with the single-pass engine
+(scripts.transform.rolling_means), scaling the number of windows and columns.
+
+    python benchmarks/rolling_benchmark.py --rows 200000 --teams 30
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "functions", "ETL"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "functions"))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from scripts.transform import rolling_means  # noqa: E402
+
+
+def groupby_rolling(df, columns, windows):
+    """What calculate_moving_average_of_num_columns used to do."""
+    means = {}
+    for window in windows:
+        means[window] = np.column_stack(
+            [
+                df.groupby("team")[col]
+                .transform(lambda x: x.rolling(window, closed="left").mean())
+                .to_numpy()
+                for col in columns
+            ]
+        )
+    return means
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--teams", type=int, default=30)
+    parser.add_argument("--windows", type=int, nargs="+", default=[5, 10, 20])
+    parser.add_argument("--columns", type=int, nargs="+", default=[2, 4, 8])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'windows':>7} {'columns':>7} {'groupby':>9} {'engine':>8} {'speedup':>8}")
+    for n_windows in args.windows:
+        windows = list(range(1, 5 * n_windows, 5))
+        for n_columns in args.columns:
+            columns = [f"col_{i}" for i in range(n_columns)]
+            df = pd.DataFrame(
+                rng.integers(80, 130, size=(args.rows, n_columns)), columns=columns
+            )
+            df["team"] = rng.integers(0, args.teams, size=args.rows)
+
+            start = time.perf_counter()
+            expected = groupby_rolling(df, columns, windows)
+            groupby_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            codes, _ = pd.factorize(df["team"])
+            actual = rolling_means(df[columns].to_numpy(), codes, windows)
+            engine_time = time.perf_counter() - start
+
+            for window in windows:
+                assert np.allclose(actual[window], expected[window], equal_nan=True)
+            print(
+                f"{n_windows:>7} {n_columns:>7} {groupby_time:>8.2f}s "
+                f"{engine_time:>7.2f}s {groupby_time / engine_time:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Times the predict function against a growing history. For every number of
+seasons, the ETL artifacts of synthetic games are written to local storage
+along with a forest of fixed parameters trained on them, then requests are
+timed: a cold one (empty artifact cache, no snapshot), warm ones served from
+the predictions snapshot, warm live inferences and warm batch requests.
+
+The request path only reads the serving bundle, that is the forest, the
+upcoming games and the metrics, or the snapshot made from them, so latency and
+memory stay flat while to_train grows.
+
+    python benchmarks/serving_benchmark.py --seasons 1 4 16 --repeat 20
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "functions", "ETL"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "functions"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from common.forest import serialize_forest  # noqa: E402
+from common.storage import LocalStorage  # noqa: E402
+from config import config as etl_config  # noqa: E402
+from scripts import transform  # noqa: E402
+from scripts.load import load, save_team_index  # noqa: E402
+from sklearn.ensemble import RandomForestRegressor  # noqa: E402
+from synthetic import generate_games, paginate  # noqa: E402
+
+# The predict function has a config module of its own
+del sys.modules["config"]
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "functions", "predict"))
+import predict  # noqa: E402
+
+FEATURES = predict.config.FEATURES
+TARGET = predict.config.TARGET
+
+
+def publish_artifacts(root: str, seasons: int, trees: int, max_depth: int) -> int:
+    """Runs the ETL transform and load tasks on `seasons` synthetic seasons,
+    then publishes a forest and its metrics. Returns the training rows."""
+    etl_config.STORAGE_BACKEND = "local"
+    etl_config.LOCAL_STORAGE_DIR = root
+    etl_config.SPOOL_DIR = root
+    etl_config.ROLLING_MODE = "full"
+    etl_config.ARTIFACT_FORMAT = "parquet"
+
+    pages = paginate(generate_games(seasons=seasons), etl_config.STREAM_PAGE_SIZE)
+    to_train, to_predict, _, team_index = transform.transform.run(pages)
+    load.run(to_train, "to_train")
+    load.run(to_predict, "to_predict")
+    save_team_index.run(team_index)
+
+    model = RandomForestRegressor(
+        n_estimators=trees, max_depth=max_depth, random_state=0, n_jobs=-1
+    ).fit(to_train[FEATURES], to_train[TARGET])
+    model_id = uuid.uuid4().hex
+    storage = LocalStorage(root)
+    storage.put(
+        predict.config.ML_FOREST_FILE,
+        serialize_forest(model, FEATURES, TARGET, {"model_id": model_id}),
+    )
+    metrics = {
+        "format_version": predict.METRICS_FORMAT_VERSION,
+        "model_id": model_id,
+        "rebuild_holdout_rmse": 0.0,
+        "rebuild_model_id": model_id,
+    }
+    storage.put(predict.config.METRICS_FILE, json.dumps(metrics).encode("utf-8"))
+    return len(to_train)
+
+
+def stored_mib(root: str, prefix: str) -> float:
+    return sum(size for _, size, _ in LocalStorage(root).list(prefix)) / 2**20
+
+
+def best_of(repeat: int, function) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def quiet(function):
+    """`function` without the logs the handler prints on every request."""
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return function()
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seasons", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--trees", type=int, default=200)
+    parser.add_argument("--max-depth", type=int, default=12)
+    parser.add_argument("--matchups", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(
+        f"{'seasons':>7} {'train rows':>10} {'history':>9} {'cold':>9} {'cold peak':>10} "
+        f"{'snapshot':>9} {'live':>9} {'batch':>9}"
+    )
+    for seasons in args.seasons:
+        root = tempfile.mkdtemp(prefix="serving_benchmark_")
+        train_rows = publish_artifacts(root, seasons, args.trees, args.max_depth)
+
+        predict.config.STORAGE_BACKEND = "local"
+        predict.config.LOCAL_STORAGE_DIR = root
+        predict.config.PREDICT_FILE_NAME = "to_predict.parquet"
+        predict._storage = None
+        predict.artifacts = predict.ArtifactCache()
+
+        get = quiet(lambda: predict.handler({}, None))
+        tracemalloc.start()
+        start = time.perf_counter()
+        get()
+        cold = time.perf_counter() - start
+        cold_peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+
+        teams = quiet(
+            lambda: predict.cached_team_index(predict.config.TEAM_INDEX_FILE)
+        )().teams
+        matchups = [
+            {"home_team": teams[i % len(teams)], "away_team": teams[(i + 1) % len(teams)]}
+            for i in range(args.matchups)
+        ]
+        batch_event = {"httpMethod": "POST", "body": json.dumps({"matchups": matchups})}
+        snapshot = best_of(args.repeat, get)
+        live = best_of(
+            args.repeat, quiet(lambda: predict.predict_games(predict.source_versions()))
+        )
+        batch = best_of(args.repeat, quiet(lambda: predict.handler(batch_event, None)))
+        print(
+            f"{seasons:>7} {train_rows:>10} {stored_mib(root, 'to_train'):>7.2f}MB "
+            f"{cold:>8.4f}s {cold_peak:>8.2f}MB {snapshot * 1000:>7.2f}ms "
+            f"{live * 1000:>7.2f}ms {batch * 1000:>7.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Times the artifact reads of the training and prediction stages against the
+local storage backend, with memory-mapped reads and with plain copying reads,
+for both artifact formats.
+
+The artifacts are the transform output of synthetic seasons, written by the
+ETL load task; the model is a pickle of `--model-mib` of tree arrays.
+
+    python benchmarks/storage_benchmark.py --seasons 5 --model-mib 64
+"""
+import argparse
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "functions", "ETL"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "functions"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import numpy as np  # noqa: E402
+from common.datasets import read_dataframe  # noqa: E402
+from common.storage import LocalStorage  # noqa: E402
+from config import config  # noqa: E402
+from scripts import transform  # noqa: E402
+from scripts.load import load  # noqa: E402
+from synthetic import generate_games, paginate  # noqa: E402
+
+FEATURES = [
+    f"home_avg_last_{window}_{side}_score"
+    for window in (5, 10, 15, 20)
+    for side in ("team", "opponent")
+]
+TARGET = ["home_team_score", "away_team_score"]
+TEAMS = ["home_team_abbreviation", "away_team_abbreviation"]
+
+
+class CopyingStorage(LocalStorage):
+    """Local storage reading whole files into memory, as a download would."""
+
+    def get(self, key):
+        stored = self.attributes(key)
+        if stored is None:
+            return None
+        with open(self.path(key), "rb") as file:
+            stored.body = file.read()
+        return stored
+
+
+def make_model(mib: int) -> dict:
+    rng = np.random.default_rng(0)
+    nodes = mib * 2**20 // 32
+    return {
+        "feature": rng.integers(0, len(FEATURES), nodes).astype(np.int64),
+        "threshold": rng.random(nodes),
+        "children": rng.integers(0, nodes, (nodes, 2)).astype(np.int64),
+    }
+
+
+def best_of(repeat: int, read) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        read()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seasons", type=int, default=5)
+    parser.add_argument("--model-mib", type=int, default=64)
+    parser.add_argument("--formats", nargs="+", default=["csv", "parquet"])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="storage_benchmark_")
+    config.STORAGE_BACKEND = "local"
+    config.LOCAL_STORAGE_DIR = root
+    config.SPOOL_DIR = root
+    config.ROLLING_MODE = "full"
+
+    pages = paginate(generate_games(seasons=args.seasons), config.STREAM_PAGE_SIZE)
+    to_train, to_predict, _, _ = transform.transform.run(pages)
+    LocalStorage(root).put("model.pkl", pickle.dumps(make_model(args.model_mib)))
+
+    backends = {"mmap": LocalStorage(root), "copy": CopyingStorage(root)}
+    print(f"{len(to_train)} train rows, {len(to_predict)} predict rows\n")
+    print(f"{'format':>8} {'read':>16} {'mmap':>9} {'copy':>9} {'speedup':>8}")
+    for artifact_format in args.formats:
+        config.ARTIFACT_FORMAT = artifact_format
+        load.run(to_train, "to_train")
+        load.run(to_predict, "to_predict")
+        suffix = ".parquet" if artifact_format == "parquet" else ".csv"
+        reads = {
+            "train data": lambda storage: read_dataframe(
+                storage, "to_train" + suffix, FEATURES + TARGET
+            ),
+            "predict data": lambda storage: read_dataframe(
+                storage, "to_predict" + suffix, TEAMS + FEATURES
+            ),
+            "model": lambda storage: pickle.loads(storage.get("model.pkl").body),
+        }
+        for name, read in reads.items():
+            timings = {
+                backend: best_of(args.repeat, lambda: read(storage))
+                for backend, storage in backends.items()
+            }
+            print(
+                f"{artifact_format:>8} {name:>16} {timings['mmap']:>8.4f}s "
+                f"{timings['copy']:>8.4f}s {timings['copy'] / timings['mmap']:>7.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
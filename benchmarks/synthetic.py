@@ -0,0 +1,120 @@
+"""Synthetic balldontlie-shaped games: whole seasons of a configurable number of
+teams, followed by unplayed future games.
+
+Every season is a sequence of rounds, each pairing every team once, two days
+apart, from late October on. Seasons always end before today and future games
+start tomorrow, so `separate_games_to_train_and_predict` splits them the same
+way it splits the real data.
+"""
+import random
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, Optional
+
+NBA_TEAMS = [
+    "ATL", "BOS", "BKN", "CHA", "CHI", "CLE", "DAL", "DEN", "DET", "GSW",
+    "HOU", "IND", "LAC", "LAL", "MEM", "MIA", "MIL", "MIN", "NOP", "NYK",
+    "OKC", "ORL", "PHI", "PHX", "POR", "SAC", "SAS", "TOR", "UTA", "WAS",
+]  # fmt: skip
+SEASON_START = (10, 20)
+DAYS_BETWEEN_ROUNDS = 2
+
+
+def team_abbreviations(n_teams: int) -> List[str]:
+    return [
+        NBA_TEAMS[i] if i < len(NBA_TEAMS) else f"X{i:02d}" for i in range(n_teams)
+    ]
+
+
+def make_team(team_id: int, abbreviation: str) -> Dict[str, any]:
+    return {
+        "id": team_id,
+        "abbreviation": abbreviation,
+        "city": f"City {team_id}",
+        "conference": "East" if team_id % 2 else "West",
+        "division": f"Division {team_id % 6}",
+        "full_name": f"City {team_id} {abbreviation}",
+        "name": abbreviation,
+    }
+
+
+def make_game(
+    game_id: int,
+    game_date: date,
+    season: int,
+    home: Dict[str, any],
+    visitor: Dict[str, any],
+    scores: Optional[tuple],
+) -> Dict[str, any]:
+    played = scores is not None
+    return {
+        "id": game_id,
+        "date": f"{game_date.isoformat()}T00:00:00.000Z",
+        "home_team": home,
+        "home_team_score": scores[0] if played else 0,
+        "period": 4 if played else 0,
+        "postseason": False,
+        "season": season,
+        "status": "Final" if played else "7:00 pm ET",
+        "time": "Final" if played else "",
+        "visitor_team": visitor,
+        "visitor_team_score": scores[1] if played else 0,
+    }
+
+
+def generate_games(
+    seasons: int = 3,
+    teams: int = 30,
+    games_per_team: int = 82,
+    future_games: int = 15,
+    today: Optional[date] = None,
+    seed: int = 0,
+) -> List[Dict[str, any]]:
+    """Games of `seasons` past seasons, ordered by date, then `future_games`
+    unplayed ones from tomorrow on."""
+    if teams < 2:
+        raise ValueError("At least two teams are needed")
+    rng = random.Random(seed)
+    today = today or date.today()
+    team_list = [
+        make_team(i + 1, abbreviation)
+        for i, abbreviation in enumerate(team_abbreviations(teams))
+    ]
+    # Team strengths, so the rolling averages aren't pure noise
+    strength = {team["id"]: rng.gauss(105, 5) for team in team_list}
+
+    def pairings() -> Iterator[tuple]:
+        shuffled = rng.sample(team_list, len(team_list))
+        return zip(shuffled[0::2], shuffled[1::2])
+
+    games = []
+    first_season = today.year - seasons - 1
+    for season in range(first_season, first_season + seasons):
+        season_start = date(season, *SEASON_START)
+        for round_index in range(games_per_team):
+            game_date = season_start + timedelta(days=round_index * DAYS_BETWEEN_ROUNDS)
+            for home, visitor in pairings():
+                scores = (
+                    max(60, round(rng.gauss(strength[home["id"]] + 3, 11))),
+                    max(60, round(rng.gauss(strength[visitor["id"]], 11))),
+                )
+                games.append(
+                    make_game(len(games) + 1, game_date, season, home, visitor, scores)
+                )
+
+    current_season = today.year if today.month >= SEASON_START[0] else today.year - 1
+    game_date = today
+    while future_games > 0:
+        game_date += timedelta(days=1)
+        for home, visitor in pairings():
+            if future_games == 0:
+                break
+            games.append(
+                make_game(len(games) + 1, game_date, current_season, home, visitor, None)
+            )
+            future_games -= 1
+    return games
+
+
+def paginate(games: List[Dict[str, any]], page_size: int = 1000) -> List[list]:
+    """Splits the games in pages, as the extract task hands them to transform."""
+    return [games[i : i + page_size] for i in range(0, len(games), page_size)]
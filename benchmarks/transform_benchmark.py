@@ -0,0 +1,209 @@
+"""Times and memory-profiles every step of the transform task, and the task as a
+whole, on synthetic seasons, and writes the results as a JSON report.
+
+Timings are the best of `--repeat` runs without tracing; peak memory comes
+from one extra run of each step under tracemalloc. Reports of two commits can
+be compared with `--baseline`.
+
+    python benchmarks/transform_benchmark.py --seasons 1 5 20 --teams 30 \
+        --future-games 15 --output transform_report.json
+    python benchmarks/transform_benchmark.py --baseline transform_report.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "functions", "ETL"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "functions"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from config import config  # noqa: E402
+from scripts import transform  # noqa: E402
+from synthetic import generate_games, paginate  # noqa: E402
+
+
+def pipeline_steps(pairing_mode: str) -> List[tuple]:
+    """(name, step) pairs replaying the transform task with ROLLING_MODE=full,
+    each step taking the previous one's output."""
+    if pairing_mode == "merge":
+        pairing = [
+            ("duplicate_dataframe", transform.duplicate_dataframe),
+            ("join_and_sort_dataframes", lambda dfs: transform.join_and_sort_dataframes(*dfs)),
+        ]
+        single_row = ("put_games_on_single_row", transform.put_games_on_single_row)
+    else:
+        pairing = [("interleave_home_and_away", transform.interleave_home_and_away)]
+        single_row = ("split_home_and_away", transform.split_home_and_away)
+    return [
+        ("games_to_dataframe", transform.games_to_dataframe),
+        ("correct_dtypes", transform.correct_dtypes),
+        *pairing,
+        (
+            "calculate_moving_average_of_num_columns",
+            transform.calculate_moving_average_of_num_columns,
+        ),
+        single_row,
+        ("remove_unnecessary_columns", transform.remove_unnecessary_columns),
+        (
+            "separate_games_to_train_and_predict",
+            transform.separate_games_to_train_and_predict,
+        ),
+    ]
+
+
+def copy_input(value):
+    """Steps may modify their input in place, every run gets its own copy."""
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    if isinstance(value, tuple):
+        return tuple(copy_input(item) for item in value)
+    return value
+
+
+def measure(step: Callable, make_input: Callable, repeat: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(repeat):
+        value = make_input()
+        start = time.perf_counter()
+        step(value)
+        timings.append(time.perf_counter() - start)
+
+    value = make_input()
+    tracemalloc.start()
+    step(value)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds": min(timings),
+        "median_seconds": float(np.median(timings)),
+        "peak_mib": peak / 2**20,
+    }
+
+
+def run_scenario(
+    seasons: int, teams: int, future_games: int, pairing_mode: str, repeat: int
+) -> Dict[str, any]:
+    games = generate_games(seasons=seasons, teams=teams, future_games=future_games)
+    pages = paginate(games, config.STREAM_PAGE_SIZE)
+    config.PAIRING_MODE = pairing_mode
+    config.ROLLING_MODE = "full"
+
+    steps = {}
+    value = pages
+    for name, step in pipeline_steps(pairing_mode):
+        steps[name] = measure(step, lambda: copy_input(value), repeat)
+        value = step(copy_input(value))
+    to_train, to_predict = value
+
+    return {
+        "seasons": seasons,
+        "teams": teams,
+        "future_games": future_games,
+        "games": len(games),
+        "pairing_mode": pairing_mode,
+        "train_rows": len(to_train),
+        "predict_rows": len(to_predict),
+        "steps": steps,
+        "transform": measure(transform.transform.run, lambda: pages, repeat),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def scenario_key(result: Dict[str, any]) -> tuple:
+    return (
+        result["seasons"],
+        result["teams"],
+        result["future_games"],
+        result["pairing_mode"],
+    )
+
+
+def print_results(results: List[Dict[str, any]], baseline: Dict[str, any] = None) -> None:
+    previous = {scenario_key(result): result for result in (baseline or {}).get("results", [])}
+    for result in results:
+        before = previous.get(scenario_key(result))
+        print(
+            f"\n{result['seasons']} seasons, {result['teams']} teams, "
+            f"{result['games']} games, pairing={result['pairing_mode']}"
+        )
+        rows = [*result["steps"].items(), ("transform (task)", result["transform"])]
+        for name, stats in rows:
+            line = f"  {name:<42} {stats['seconds']:>8.3f}s {stats['peak_mib']:>9.1f} MiB"
+            if before:
+                old = before["steps"].get(name) or (
+                    before["transform"] if name == "transform (task)" else None
+                )
+                if old:
+                    line += (
+                        f"   x{stats['seconds'] / old['seconds']:.2f} time"
+                        f"  x{stats['peak_mib'] / max(old['peak_mib'], 1e-9):.2f} memory"
+                    )
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seasons", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--teams", type=int, default=30)
+    parser.add_argument("--future-games", type=int, default=15)
+    parser.add_argument(
+        "--pairing-modes", nargs="+", default=["merge", "interleaved"]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="transform_report.json")
+    parser.add_argument("--baseline", help="Report of a previous run to compare with")
+    args = parser.parse_args()
+
+    # The memory report of every stage would drown the results
+    logging.getLogger("prefect.transform").setLevel(logging.WARNING)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = [
+        run_scenario(seasons, args.teams, args.future_games, pairing_mode, args.repeat)
+        for seasons in args.seasons
+        for pairing_mode in args.pairing_modes
+    ]
+    print_results(results, baseline)
+
+    report = {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
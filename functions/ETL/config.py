@@ -1,13 +1,53 @@
+import os
 from dataclasses import dataclass, field
 from datetime import date
-from typing import List
+from typing import Dict, List
 
 
 @dataclass
 class AppConfig:
+    S3_BUCKET: str = os.getenv("S3_BUCKET")
     START_DATE: str = "01/01/2020"
     # NBA_LEAGUE_ID: str = "00"
-    BASE_NBA_URL = "https://www.balldontlie.io/api/v1/games"
+    BASE_NBA_URL: str = os.getenv(
+        "BASE_NBA_URL", "https://www.balldontlie.io/api/v1/games"
+    )
+    FIRST_PAGE: int = 1
+    FETCH_WORKERS: int = int(os.getenv("FETCH_WORKERS", "4"))
+    FETCH_REQUESTS_PER_MINUTE: float = float(os.getenv("FETCH_REQUESTS_PER_MINUTE", "60"))
+    FETCH_MAX_RETRIES: int = 5
+    FETCH_BACKOFF_SECONDS: float = 0.5
+    FETCH_TIMEOUT_SECONDS: float = 30
+    # Where the artifacts live: "s3" (S3_BUCKET) or "local" (LOCAL_STORAGE_DIR)
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "s3")
+    LOCAL_STORAGE_DIR: str = os.getenv("LOCAL_STORAGE_DIR")
+    # Raw API pages cache: "disk", "s3" (the artifacts storage) or "none"
+    RESPONSE_CACHE: str = os.getenv("RESPONSE_CACHE", "disk")
+    RESPONSE_CACHE_DIR: str = "/tmp/balldontlie_cache"
+    RESPONSE_CACHE_PREFIX: str = "cache/balldontlie/"
+    RESPONSE_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    RESPONSE_CACHE_TTL_SECONDS: float = 10 * 60
+    # Incremental extraction: only the window after the watermark is fetched
+    # and merged into the games history stored in the bucket
+    INCREMENTAL_EXTRACT: bool = os.getenv("INCREMENTAL_EXTRACT", "true").lower() == "true"
+    WATERMARK_KEY: str = "extract/watermark.json"
+    GAMES_HISTORY_KEY: str = "extract/games.jsonl.gz"
+    FINAL_GAME_STATUS: str = "Final"
+    # Games not final yet only hold the watermark back for this many days past
+    # their date; older ones (postponed, cancelled) are re-fetched by ID
+    PENDING_GRACE_DAYS: int = 3
+    # Flow executor: "local" runs the tasks one after another, "threads" and
+    # "processes" in a local Dask pool of FLOW_WORKERS, "dask" on the Dask
+    # cluster at DASK_ADDRESS (a temporary local one when unset), which must
+    # run on this machine since the tasks pass local spool files around.
+    # Processes don't share the fetch rate limit, and Lambda has no /dev/shm
+    # for them
+    FLOW_EXECUTOR: str = os.getenv("FLOW_EXECUTOR", "local")
+    FLOW_WORKERS: int = int(os.getenv("FLOW_WORKERS", "4"))
+    DASK_ADDRESS: str = os.getenv("DASK_ADDRESS")
+    # Games are spooled to local files and streamed to transform page by page
+    SPOOL_DIR: str = "/tmp/etl"
+    STREAM_PAGE_SIZE: int = 1000
     PRE_SELECTED_FEATURES: List[str] = field(
         default_factory=lambda: [
             "id",
@@ -16,12 +56,53 @@ class AppConfig:
             "visitor_team_abbreviation",
             "home_team_score",
             "visitor_team_score",
+            "status",
         ]
     )
+    # Dtype policy, applied when the games are ingested and kept by every step
+    ID_DTYPE: str = "int32"
+    TEAM_DTYPE: str = "category"
+    SCORE_DTYPE: str = "int16"
+    FEATURE_DTYPE: str = "float32"
+    # Typed columns the pre-selected features are accumulated into
+    COLUMN_DTYPES: Dict[str, str] = field(
+        default_factory=lambda: {
+            "id": AppConfig.ID_DTYPE,
+            "date": "datetime64[ns]",
+            "home_team_abbreviation": AppConfig.TEAM_DTYPE,
+            "visitor_team_abbreviation": AppConfig.TEAM_DTYPE,
+            "home_team_score": AppConfig.SCORE_DTYPE,
+            "visitor_team_score": AppConfig.SCORE_DTYPE,
+            # From the status: the scores of a game not final can still change
+            "is_final": "bool",
+        }
+    )
     MIN_GAMES_PER_TEAM: int = 100
     MOVING_AVERAGE_WINDOWS: List[int] = field(
         default_factory=lambda: [1, 5, 10, 15, 20]
     )
+    # Home/away pairing: "merge" duplicates, concatenates and joins the games
+    # back on id, "interleaved" builds index-aligned home/away rows instead
+    PAIRING_MODE: str = os.getenv("PAIRING_MODE", "merge")
+    # Moving averages: "full" recomputes them over the whole history,
+    # "incremental" updates a per-team state persisted between runs and
+    # "verify" does the latter and checks it against the former
+    ROLLING_MODE: str = os.getenv("ROLLING_MODE", "full")
+    ROLLING_STATE_KEY: str = "transform/rolling_state.json"
+    TRAIN_FILE_NAME: str = "to_train"
+    PREDICT_FILE_NAME: str = "to_predict"
+    # Latest moving averages of every team, for the ad-hoc matchups of the API
+    TEAM_INDEX_KEY: str = "team_index.json"
+    # Output artifacts: "csv" files or "parquet" datasets partitioned by season
+    ARTIFACT_FORMAT: str = os.getenv("ARTIFACT_FORMAT", "csv")
+    PARQUET_COMPRESSION: str = "snappy"
+    # Artifacts carry the sha256 of their content in their metadata, and
+    # aren't uploaded again while it doesn't change
+    FINGERPRINT_METADATA_KEY: str = "sha256"
+    CSV_CHUNK_ROWS: int = 50_000
+    MULTIPART_THRESHOLD_BYTES: int = 8 * 1024 * 1024
+    MULTIPART_CHUNK_BYTES: int = 8 * 1024 * 1024
+    SEASON_START_MONTH: int = 10
     TEAM_NAME_COLUMN: str = "team_abbreviation"
     OPPONENT_TEAM_COLUMN: str = "opponent_team_abbreviation"
 
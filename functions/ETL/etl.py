@@ -1,18 +1,59 @@
 import os
+from urllib.parse import urlsplit
 
+from config import config
 from prefect import Flow
+from prefect.executors import DaskExecutor, LocalDaskExecutor, LocalExecutor
 
-from scripts.extract import extract
-from scripts.load import load
+from scripts.extract import extract_range, merge_extracts, plan_extract
+from scripts.load import load, save_rolling_state, save_team_index
 from scripts.transform import transform
 
 
+def create_executor():
+    if config.FLOW_EXECUTOR == "local":
+        return LocalExecutor()
+    if config.FLOW_EXECUTOR in ("threads", "processes"):
+        return LocalDaskExecutor(
+            scheduler=config.FLOW_EXECUTOR, num_workers=config.FLOW_WORKERS
+        )
+    if config.FLOW_EXECUTOR == "dask":
+        if config.DASK_ADDRESS and not is_local_address(config.DASK_ADDRESS):
+            raise ValueError(
+                f"DASK_ADDRESS {config.DASK_ADDRESS} isn't local: the tasks pass "
+                f"spool files of {config.SPOOL_DIR} to each other"
+            )
+        return DaskExecutor(address=config.DASK_ADDRESS)
+    raise ValueError(f"Unknown FLOW_EXECUTOR: {config.FLOW_EXECUTOR}")
+
+
+def is_local_address(address: str) -> bool:
+    """Whether a Dask scheduler address is on this machine."""
+    parts = urlsplit(address if "://" in address else f"tcp://{address}")
+    return parts.scheme == "inproc" or parts.hostname in ("localhost", "127.0.0.1", "::1")
+
+
+def extract_games(
+    start_date: str = config.START_DATE, incremental: bool = config.INCREMENTAL_EXTRACT
+):
+    """Fetches every date range in its own mapped task, then reduces them into
+    a single games file."""
+    date_ranges, watermark = plan_extract(start_date=start_date, incremental=incremental)
+    spooled = extract_range.map(date_ranges)
+    return merge_extracts(spooled, watermark, incremental=incremental)
+
+
 def prefect_flow():
-    with Flow(name="nba_etl_pipeline") as flow:
-        games_data = extract()
-        to_train, to_predict = transform(games_data)
-        load(to_train, file_name="to_train")
-        load(to_predict, file_name="to_predict")
+    with Flow(name="nba_etl_pipeline", executor=create_executor()) as flow:
+        games_data = extract_games()
+        to_train, to_predict, rolling_state, team_index = transform(games_data)
+        train_loaded = load(to_train, file_name=config.TRAIN_FILE_NAME)
+        predict_loaded = load(to_predict, file_name=config.PREDICT_FILE_NAME)
+        save_team_index(team_index)
+        # The state must never get ahead of the published training set
+        save_rolling_state(
+            rolling_state, upstream_tasks=[train_loaded, predict_loaded]
+        )
 
     return flow
 
@@ -0,0 +1,174 @@
+import base64
+import gzip
+import hashlib
+import json
+import threading
+from io import BytesIO
+from typing import BinaryIO, Dict, List, Optional, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from config import config
+from pandas import DataFrame
+
+from common.datasets import read_parquet_dataset
+from common.storage import create_storage
+
+
+def dataset_prefix(name: str) -> str:
+    return f"{name}.parquet"
+
+
+def manifest_key(name: str) -> str:
+    return f"{dataset_prefix(name)}/_manifest.json"
+
+
+_storage_lock = threading.Lock()
+_storages = {}
+
+
+def get_storage():
+    """Storage of the pipeline artifacts, as configured. Artifacts above the
+    multipart threshold are uploaded to S3 in parts, concurrently.
+
+    Built once per configuration and shared by the tasks of the flow: a boto3
+    client can be used from many threads, but creating clients concurrently
+    from the default session isn't thread-safe."""
+    settings = (
+        config.STORAGE_BACKEND,
+        config.S3_BUCKET,
+        config.LOCAL_STORAGE_DIR,
+        config.MULTIPART_THRESHOLD_BYTES,
+        config.MULTIPART_CHUNK_BYTES,
+    )
+    with _storage_lock:
+        if settings not in _storages:
+            _storages[settings] = create_storage(
+                config.STORAGE_BACKEND,
+                bucket=config.S3_BUCKET,
+                root=config.LOCAL_STORAGE_DIR,
+                multipart_threshold=config.MULTIPART_THRESHOLD_BYTES,
+                multipart_chunksize=config.MULTIPART_CHUNK_BYTES,
+            )
+        return _storages[settings]
+
+
+def stored_fingerprint(storage, key: str) -> Optional[str]:
+    """Fingerprint the object was uploaded with, None if it doesn't exist."""
+    stored = storage.head(key)
+    if stored is None:
+        return None
+    return stored.metadata.get(config.FINGERPRINT_METADATA_KEY)
+
+
+def upload_if_changed(
+    storage,
+    key: str,
+    body: Union[bytes, BinaryIO],
+    fingerprint: str,
+    content_type: Optional[str] = None,
+    content_encoding: Optional[str] = None,
+) -> bool:
+    """Uploads `body` unless the stored object has the same fingerprint.
+    Returns whether it was uploaded."""
+    if stored_fingerprint(storage, key) == fingerprint:
+        return False
+    storage.put(
+        key,
+        body,
+        metadata={config.FINGERPRINT_METADATA_KEY: fingerprint},
+        content_type=content_type,
+        content_encoding=content_encoding,
+    )
+    return True
+
+
+def write_csv_gzip(df: DataFrame, path: str) -> str:
+    """Serializes `df` as gzipped CSV a chunk of rows at a time, and returns the
+    sha256 of the uncompressed CSV."""
+    hasher = hashlib.sha256()
+    # No timestamp in the gzip header, the same CSV always compresses the same
+    with gzip.GzipFile(path, "wb", mtime=0) as f:
+        for start in range(0, max(len(df), 1), config.CSV_CHUNK_ROWS):
+            chunk = df.iloc[start : start + config.CSV_CHUNK_ROWS].to_csv(
+                index=False, header=start == 0
+            )
+            data = chunk.encode("utf-8")
+            hasher.update(data)
+            f.write(data)
+    return hasher.hexdigest()
+
+
+def season_of(dates: pd.Series) -> pd.Series:
+    """NBA season of each date, named after the year it starts in."""
+    return dates.dt.year - (dates.dt.month < config.SEASON_START_MONTH).astype("int64")
+
+
+def table_to_parquet(table: pa.Table) -> bytes:
+    buffer = BytesIO()
+    pq.write_table(table, buffer, compression=config.PARQUET_COMPRESSION)
+    return buffer.getvalue()
+
+
+def read_manifest(storage, name: str) -> Optional[Dict[str, any]]:
+    stored = storage.get(manifest_key(name))
+    if stored is None:
+        return None
+    return json.loads(stored.read())
+
+
+def write_dataset(
+    storage, name: str, df: DataFrame, date_column: str = "home_date"
+) -> bool:
+    """Writes `df` as a Parquet dataset with one file per season, then the
+    manifest listing them along with the Arrow schema.
+
+    Partition files are named after their content, so a season that didn't
+    change keeps its file and isn't uploaded again, and readers of the previous
+    manifest never see a half-written partition. Files the new manifest no
+    longer lists are deleted once it's written. Returns whether the dataset
+    changed.
+    """
+    previous = read_manifest(storage, name)
+    previous_keys = {part["key"] for part in previous["partitions"]} if previous else set()
+
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    seasons = season_of(df[date_column])
+    partitions = []
+    for season in sorted(seasons.unique()):
+        part = df[(seasons == season).to_numpy()]
+        body = table_to_parquet(
+            pa.Table.from_pandas(part, schema=schema, preserve_index=False)
+        )
+        digest = hashlib.sha256(body).hexdigest()
+        key = f"{dataset_prefix(name)}/season={season}/part-{digest[:16]}.parquet"
+        if key not in previous_keys:
+            upload_if_changed(storage, key, body, digest)
+        partitions.append({"season": int(season), "key": key, "rows": len(part)})
+
+    manifest = {
+        "format": "parquet",
+        "rows": len(df),
+        "schema": base64.b64encode(schema.serialize().to_pybytes()).decode("ascii"),
+        "partitions": partitions,
+    }
+    body = json.dumps(manifest).encode("utf-8")
+    changed = upload_if_changed(
+        storage,
+        manifest_key(name),
+        body,
+        hashlib.sha256(body).hexdigest(),
+        content_type="application/json",
+    )
+
+    stale_keys = previous_keys - {part["key"] for part in partitions}
+    for key in stale_keys:
+        storage.delete(key)
+    return changed
+
+
+def read_dataset(
+    storage, name: str, columns: Optional[List[str]] = None
+) -> Optional[DataFrame]:
+    return read_parquet_dataset(storage, dataset_prefix(name), columns)
@@ -0,0 +1,178 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from config import config
+
+from scripts.artifacts import get_storage
+from scripts.history import is_final
+
+
+class DiskStore:
+    """Cache entries as files, evicting the least recently read ones once the
+    directory grows over `max_bytes`."""
+
+    def __init__(self, root: str, max_bytes: int) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def read(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self.path(key), "rb") as file:
+                body = file.read()
+        except FileNotFoundError:
+            return None
+        os.utime(self.path(key))  # mtime doubles as last access for eviction
+        return body
+
+    def write(self, key: str, body: bytes) -> None:
+        temp_path = self.path(key) + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(body)
+        os.replace(temp_path, self.path(key))
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self) -> int:
+        entries = []
+        for name in os.listdir(self.root):
+            stat = os.stat(self.path(name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self.delete(name)
+            total -= size
+            evicted += 1
+        return evicted
+
+
+class StorageStore:
+    """Cache entries as objects under a prefix of the artifacts storage (the
+    bucket on Lambda). S3 doesn't track reads, so eviction drops the oldest
+    writes first."""
+
+    def __init__(self, storage, prefix: str, max_bytes: int) -> None:
+        self.storage = storage
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+
+    def read(self, key: str) -> Optional[bytes]:
+        stored = self.storage.get(self.prefix + key)
+        return stored.read() if stored is not None else None
+
+    def write(self, key: str, body: bytes) -> None:
+        self.storage.put(self.prefix + key, body)
+
+    def delete(self, key: str) -> None:
+        self.storage.delete(self.prefix + key)
+
+    def evict(self) -> int:
+        entries = [
+            (modified, size, key)
+            for key, size, modified in self.storage.list(self.prefix)
+        ]
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self.storage.delete(key)
+            total -= size
+            evicted += 1
+        return evicted
+
+
+class ResponseCache:
+    """Raw API pages keyed by a hash of the request.
+
+    Pages where every game is final never expire; pages with scheduled or
+    in-progress games are kept for `ttl_seconds` only.
+    """
+
+    def __init__(self, store, ttl_seconds: float) -> None:
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.lock = threading.Lock()
+
+    def count(self, counter: str) -> None:
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    @staticmethod
+    def key(url: str, params: Dict[str, any]) -> str:
+        request = json.dumps({"url": url, "params": params}, sort_keys=True, default=str)
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+    def get(self, url: str, params: Dict[str, any]) -> Optional[Dict[str, any]]:
+        key = self.key(url, params)
+        body = self.store.read(key)
+        if body is None:
+            self.count("misses")
+            return None
+
+        entry = json.loads(gzip.decompress(body))
+        if entry["expires_at"] is not None and entry["expires_at"] < time.time():
+            self.store.delete(key)
+            self.count("expired")
+            self.count("misses")
+            return None
+
+        self.count("hits")
+        return entry["data"]
+
+    def put(self, url: str, params: Dict[str, any], data: Dict[str, any]) -> None:
+        games: List[Dict[str, any]] = data["data"]
+        if games and all(is_final(game) for game in games):
+            expires_at = None
+        else:
+            expires_at = time.time() + self.ttl_seconds
+        entry = {"expires_at": expires_at, "data": data}
+        body = gzip.compress(json.dumps(entry).encode("utf-8"))
+        self.store.write(self.key(url, params), body)
+
+    def evict(self) -> int:
+        return self.store.evict()
+
+    def stats(self) -> Dict[str, any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def create_response_cache() -> Optional[ResponseCache]:
+    """Builds the cache configured by RESPONSE_CACHE ("disk", "s3" or "none")."""
+    if config.RESPONSE_CACHE == "disk":
+        store = DiskStore(config.RESPONSE_CACHE_DIR, config.RESPONSE_CACHE_MAX_BYTES)
+    elif config.RESPONSE_CACHE == "s3":
+        store = StorageStore(
+            get_storage(),
+            config.RESPONSE_CACHE_PREFIX,
+            config.RESPONSE_CACHE_MAX_BYTES,
+        )
+    elif config.RESPONSE_CACHE == "none":
+        return None
+    else:
+        raise ValueError(f"Unknown RESPONSE_CACHE: {config.RESPONSE_CACHE}")
+    return ResponseCache(store, ttl_seconds=config.RESPONSE_CACHE_TTL_SECONDS)
@@ -0,0 +1,77 @@
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+
+class ColumnBuffer:
+    """Typed array that grows by doubling, so appending chunks is amortized O(1)."""
+
+    def __init__(self, dtype, capacity: int = 1024) -> None:
+        self.data = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values: np.ndarray) -> None:
+        values = np.asarray(values, dtype=self.data.dtype)
+        needed = self.size + len(values)
+        if needed > len(self.data):
+            grown = np.empty(max(needed, 2 * len(self.data)), dtype=self.data.dtype)
+            grown[: self.size] = self.data[: self.size]
+            self.data = grown
+        self.data[self.size : needed] = values
+        self.size = needed
+
+    @property
+    def values(self) -> np.ndarray:
+        return self.data[: self.size]
+
+
+class CategoryBuffer:
+    """Dictionary-encoded column: values are stored as int16 codes into a
+    vocabulary that may be shared with other columns, so that e.g. home and
+    visitor teams end up with the same categories."""
+
+    def __init__(self, vocabulary: Dict[str, int]) -> None:
+        self.vocabulary = vocabulary
+        self.codes = ColumnBuffer("int16")
+
+    def extend(self, values: np.ndarray) -> None:
+        uniques, inverse = np.unique(np.asarray(values, dtype=object), return_inverse=True)
+        page_codes = np.array(
+            [self.vocabulary.setdefault(value, len(self.vocabulary)) for value in uniques],
+            dtype="int16",
+        )
+        self.codes.extend(page_codes[inverse])
+
+    @property
+    def size(self) -> int:
+        return self.codes.size
+
+    @property
+    def values(self) -> pd.Categorical:
+        categories: List[str] = list(self.vocabulary)
+        return pd.Categorical.from_codes(self.codes.values, categories=categories)
+
+
+class ColumnStore:
+    """Set of growing typed columns filled one chunk at a time."""
+
+    def __init__(self, dtypes: Dict[str, str]) -> None:
+        vocabulary = {}
+        self.buffers = {
+            name: CategoryBuffer(vocabulary) if dtype == "category" else ColumnBuffer(dtype)
+            for name, dtype in dtypes.items()
+        }
+
+    def append(self, chunk: Dict[str, np.ndarray]) -> None:
+        for name, buffer in self.buffers.items():
+            buffer.extend(chunk[name])
+
+    def __len__(self) -> int:
+        return next(iter(self.buffers.values())).size if self.buffers else 0
+
+    def to_frame(self) -> DataFrame:
+        return pd.DataFrame(
+            {name: buffer.values for name, buffer in self.buffers.items()}
+        )
@@ -1,37 +1,180 @@
-from typing import Dict, List, Optional
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
 
-import requests
+import prefect
 from config import config
 from prefect import task
 
+from scripts.artifacts import get_storage
+from scripts.fetch import get_fetcher
+from scripts.history import (
+    GamesFile,
+    download_history,
+    iter_games_file,
+    merge_games,
+    next_start_date,
+    read_watermark,
+    spool_path,
+    upload_history,
+    write_games_file,
+    write_watermark,
+)
 
-def fetch_games(start_date: str, end_date: str = None, per_page: int = 100) -> list:
-    base_url = config.BASE_NBA_URL
-    games = []
-    page = 0
 
-    while True:
-        params = {
-            "start_date": start_date,
-            "end_date": end_date,
-            "per_page": per_page,
-            "page": page,
-        }
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()
-        data = response.json()
+def fetch_pages(params: Dict[str, any]) -> list:
+    return get_fetcher().fetch_all(params)
+
 
-        games.extend(data["data"])
+def iter_game_pages(
+    start_date: str, end_date: str = None, per_page: int = 100
+) -> Iterator[List[Dict[str, any]]]:
+    params = {
+        "start_date": start_date,
+        "end_date": end_date,
+        "per_page": per_page,
+    }
+    return get_fetcher().iter_pages(params)
 
-        if data["meta"]["next_page"] is None:
-            break
-        page += 1
 
+def fetch_games_by_id(game_ids: List[int], per_page: int = 100) -> list:
+    games = []
+    for i in range(0, len(game_ids), per_page):
+        params = {"game_ids[]": game_ids[i : i + per_page], "per_page": per_page}
+        games.extend(fetch_pages(params))
     return games
 
 
+def parse_date(value: str) -> date:
+    """Parses the API date formats, MM/DD/YYYY and YYYY-MM-DD."""
+    if "/" in value:
+        return datetime.strptime(value, "%m/%d/%Y").date()
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def split_date_range(
+    start_date: str, end_date: Optional[str] = None, today: Optional[date] = None
+) -> List[Dict[str, Optional[str]]]:
+    """Splits the window at every season start, so each season can be fetched
+    independently. The last range is open-ended when the window is."""
+    start = parse_date(start_date)
+    end = parse_date(end_date) if end_date else None
+    last = end or today or date.today()
+
+    ranges = []
+    year = start.year if start.month < config.SEASON_START_MONTH else start.year + 1
+    season_start = date(year, config.SEASON_START_MONTH, 1)
+    while season_start <= last:
+        ranges.append(
+            {
+                "start_date": start.isoformat(),
+                "end_date": (season_start - timedelta(days=1)).isoformat(),
+            }
+        )
+        start = season_start
+        season_start = date(season_start.year + 1, config.SEASON_START_MONTH, 1)
+    ranges.append(
+        {"start_date": start.isoformat(), "end_date": end.isoformat() if end else None}
+    )
+    return ranges
+
+
+def range_spool_path(date_range: Dict[str, Optional[str]]) -> str:
+    return spool_path(f"games-{date_range['start_date']}.jsonl.gz")
+
+
+@task
+def plan_extract(
+    start_date: str = config.START_DATE,
+    end_date: Optional[str] = None,
+    incremental: bool = config.INCREMENTAL_EXTRACT,
+) -> Tuple[List[Dict[str, Optional[str]]], Optional[Dict[str, any]]]:
+    """Returns the date ranges to fetch and the stored watermark.
+
+    A backfill gets one range per season. An incremental run with a stored
+    history only fetches the window after its watermark; the history is
+    downloaded to the spool directory for merge_extracts.
+    """
+    watermark = None
+    if incremental:
+        storage = get_storage()
+        watermark = read_watermark(storage)
+        history_path = spool_path("history.jsonl.gz")
+        if watermark and not download_history(storage, history_path):
+            watermark = None
+
+    if watermark:
+        return [{"start_date": next_start_date(watermark), "end_date": end_date}], watermark
+    return split_date_range(start_date, end_date), None
+
+
+@task
+def extract_range(date_range: Dict[str, Optional[str]]) -> str:
+    """Streams the games of one date range to its own spool file, page by page."""
+    path = range_spool_path(date_range)
+    pages = iter_game_pages(date_range["start_date"], date_range["end_date"])
+    write_games_file(path, (game for page in pages for game in page))
+    return path
+
+
+def merge_delta(
+    delta_path: str, watermark: Dict[str, any], games_file: GamesFile
+) -> Optional[Dict[str, any]]:
+    """Merges the games fetched after the watermark into the stored history.
+    Only the fetched window is held in memory."""
+    delta = list(iter_games_file(delta_path))
+
+    # Pending games outside the window (e.g. rescheduled) are looked up
+    # by ID; the ones the API no longer returns are dropped
+    fetched_ids = {game["id"] for game in delta}
+    missing_ids = [
+        game_id
+        for game_id in watermark["pending_game_ids"]
+        if game_id not in fetched_ids
+    ]
+    if missing_ids:
+        delta.extend(fetch_games_by_id(missing_ids))
+        fetched_ids = {game["id"] for game in delta}
+    dropped_ids = [game_id for game_id in missing_ids if game_id not in fetched_ids]
+
+    history_path = spool_path("history.jsonl.gz")
+    return write_games_file(
+        games_file.path,
+        merge_games(iter_games_file(history_path), delta, dropped_ids=dropped_ids),
+    )
+
+
 @task
-def extract(
-    start_date: str = config.START_DATE, end_date: Optional[str] = None
-) -> List[Dict[str, any]]:
-    return fetch_games(start_date, end_date)
+def merge_extracts(
+    paths: List[str],
+    watermark: Optional[Dict[str, any]],
+    incremental: bool = config.INCREMENTAL_EXTRACT,
+) -> GamesFile:
+    """Reduces the spooled ranges into a single games file, returned as an
+    iterable of pages. Incremental runs merge them into the stored history and
+    upload it along with its new watermark."""
+    games_file = GamesFile(spool_path("games.jsonl.gz"))
+    if watermark:
+        new_watermark = merge_delta(paths[0], watermark, games_file)
+    else:
+        new_watermark = write_games_file(
+            games_file.path, (game for path in paths for game in iter_games_file(path))
+        )
+    for path in paths:
+        os.remove(path)
+
+    if incremental:
+        # History goes first: if the watermark write fails, the next run just
+        # fetches an overlapping window again
+        storage = get_storage()
+        upload_history(storage, games_file.path)
+        if new_watermark:
+            write_watermark(storage, new_watermark)
+
+    cache = get_fetcher().cache
+    if cache is not None:
+        evicted = cache.evict()
+        prefect.context.get("logger").info(
+            f"Response cache: {cache.stats()}, evicted {evicted} entries"
+        )
+    return games_file
@@ -0,0 +1,164 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+import requests
+from config import config
+from requests.adapters import HTTPAdapter
+
+from scripts.cache import ResponseCache, create_response_cache
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class PageFetcher:
+    """Fetches every page of a balldontlie listing over a pooled session.
+
+    The first page tells how many pages there are (`meta.total_pages`), the rest
+    are fetched concurrently. Every request goes through the rate limiter and is
+    retried with exponential backoff on connection errors, 429 and 5xx.
+
+    With a response cache, the first page is always fetched (its meta is what
+    tells whether the listing changed) and the other pages are keyed by the
+    listing's `total_count` too, so they are only served while it is unchanged.
+
+    `listings` is how many listings may be fetched at once through the same
+    fetcher, e.g. the date ranges of the flow mapped over FLOW_WORKERS: the
+    connection pool holds `workers` connections for each.
+    """
+
+    def __init__(
+        self,
+        base_url: str = config.BASE_NBA_URL,
+        workers: int = config.FETCH_WORKERS,
+        requests_per_minute: float = config.FETCH_REQUESTS_PER_MINUTE,
+        max_retries: int = config.FETCH_MAX_RETRIES,
+        backoff_seconds: float = config.FETCH_BACKOFF_SECONDS,
+        timeout: float = config.FETCH_TIMEOUT_SECONDS,
+        cache: Optional[ResponseCache] = None,
+        listings: int = config.FLOW_WORKERS,
+    ) -> None:
+        self.base_url = base_url
+        self.workers = max(1, workers)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+        self.cache = cache
+        self.rate_limiter = TokenBucket(
+            rate=requests_per_minute / 60, capacity=max(1, self.workers)
+        )
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=self.workers * max(1, listings)
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        delay = self.backoff_seconds * 2**attempt
+        return delay + random.uniform(0, delay)
+
+    def get_cached_page(self, params: Dict[str, any], total_count: int):
+        if self.cache is None:
+            return self.get_page(params)
+
+        cache_params = {**params, "total_count": total_count}
+        data = self.cache.get(self.base_url, cache_params)
+        if data is None:
+            data = self.get_page(params)
+            self.cache.put(self.base_url, cache_params, data)
+        return data
+
+    def get_page(self, params: Dict[str, any]) -> Dict[str, any]:
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                response = self.session.get(
+                    self.base_url, params=params, timeout=self.timeout
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self.backoff(attempt))
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                time.sleep(self.backoff(attempt, response.headers.get("Retry-After")))
+                continue
+            response.raise_for_status()
+            return response.json()
+
+    def iter_pages(self, params: Dict[str, any]) -> Iterator[List[Dict[str, any]]]:
+        """Yields the games of each page in order. At most two pages per worker
+        are in flight, so memory doesn't grow with the listing size."""
+        first_page = self.get_page({**params, "page": config.FIRST_PAGE})
+        total_pages = first_page["meta"].get("total_pages") or config.FIRST_PAGE
+        total_count = first_page["meta"].get("total_count")
+        pages = [
+            {**params, "page": page}
+            for page in range(config.FIRST_PAGE + 1, total_pages + 1)
+        ]
+        yield first_page["data"]
+
+        if self.workers == 1 or len(pages) <= 1:
+            for page in pages:
+                yield self.get_cached_page(page, total_count)["data"]
+            return
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            in_flight = deque()
+            for page in pages:
+                in_flight.append(
+                    executor.submit(self.get_cached_page, page, total_count)
+                )
+                if len(in_flight) >= 2 * self.workers:
+                    yield in_flight.popleft().result()["data"]
+            while in_flight:
+                yield in_flight.popleft().result()["data"]
+
+    def fetch_all(self, params: Dict[str, any]) -> List[Dict[str, any]]:
+        return [game for page in self.iter_pages(params) for game in page]
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher() -> PageFetcher:
+    """Returns the shared fetcher, so connections survive across calls and warm
+    Lambda invocations, and tasks running in threads share its rate limit."""
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = PageFetcher(cache=create_response_cache())
+    return _fetcher
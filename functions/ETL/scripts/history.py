@@ -0,0 +1,152 @@
+import gzip
+import json
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from config import config
+
+
+def game_date(game: Dict[str, any]) -> str:
+    """Returns the game date as YYYY-MM-DD."""
+    return game["date"][:10]
+
+
+def is_final(game: Dict[str, any]) -> bool:
+    """Checks whether the game is over and its score won't change anymore."""
+    return game.get("status") == config.FINAL_GAME_STATUS
+
+
+def pending_cutoff(today: Optional[date] = None) -> str:
+    """Returns the first date whose games not final yet are still expected to
+    finish, as YYYY-MM-DD. Older ones are stale: postponed, cancelled or never
+    updated."""
+    today = today or date.today()
+    return (today - timedelta(days=config.PENDING_GRACE_DAYS)).isoformat()
+
+
+class WatermarkTracker:
+    """Tracks the last fully final date and the IDs of the games not yet final
+    while the games stream by.
+
+    Only pending games dated from `cutoff` on hold the watermark back, so a
+    stale one doesn't pin every later run to its date; its ID is still tracked.
+    """
+
+    def __init__(self, cutoff: Optional[str] = None) -> None:
+        self.cutoff = cutoff or pending_cutoff()
+        self.max_date = None
+        self.first_pending_date = None
+        self.pending_game_ids = []
+
+    def add(self, game: Dict[str, any]) -> None:
+        date = game_date(game)
+        if self.max_date is None or date > self.max_date:
+            self.max_date = date
+        if not is_final(game):
+            self.pending_game_ids.append(game["id"])
+            if date < self.cutoff:
+                return
+            if self.first_pending_date is None or date < self.first_pending_date:
+                self.first_pending_date = date
+
+    def watermark(self) -> Optional[Dict[str, any]]:
+        if self.max_date is None:
+            return None
+
+        if self.first_pending_date is not None:
+            last_final_date = (
+                datetime.strptime(self.first_pending_date, "%Y-%m-%d")
+                - timedelta(days=1)
+            ).strftime("%Y-%m-%d")
+        else:
+            last_final_date = self.max_date
+
+        return {
+            "last_final_date": last_final_date,
+            "pending_game_ids": sorted(self.pending_game_ids),
+        }
+
+
+def next_start_date(watermark: Dict[str, any]) -> str:
+    """Returns the first date that must be fetched again."""
+    last_final_date = datetime.strptime(watermark["last_final_date"], "%Y-%m-%d")
+    return (last_final_date + timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def merge_games(
+    history: Iterable[Dict[str, any]],
+    delta: List[Dict[str, any]],
+    dropped_ids: Iterable[int] = (),
+) -> Iterator[Dict[str, any]]:
+    """Streams the history with freshly fetched games merged in, newest version
+    wins. Only the delta is held in memory."""
+    replaced_ids = {game["id"] for game in delta} | set(dropped_ids)
+    for game in history:
+        if game["id"] not in replaced_ids:
+            yield game
+    yield from delta
+
+
+def spool_path(name: str) -> str:
+    os.makedirs(config.SPOOL_DIR, exist_ok=True)
+    return os.path.join(config.SPOOL_DIR, name)
+
+
+def iter_games_file(path: str) -> Iterator[Dict[str, any]]:
+    with gzip.open(path, "rt", encoding="utf-8") as lines:
+        for line in lines:
+            yield json.loads(line)
+
+
+def write_games_file(
+    path: str, games: Iterable[Dict[str, any]]
+) -> Optional[Dict[str, any]]:
+    """Writes the games as gzipped JSON lines and returns their watermark."""
+    tracker = WatermarkTracker()
+    temp_path = path + ".tmp"
+    with gzip.open(temp_path, "wt", encoding="utf-8", compresslevel=1) as lines:
+        for game in games:
+            tracker.add(game)
+            lines.write(json.dumps(game) + "\n")
+    os.replace(temp_path, path)
+    return tracker.watermark()
+
+
+class GamesFile:
+    """Games spooled to a local gzipped JSON lines file, read back one page at a
+    time so consumers never hold more than `page_size` raw games."""
+
+    def __init__(self, path: str, page_size: int = config.STREAM_PAGE_SIZE) -> None:
+        self.path = path
+        self.page_size = page_size
+
+    def __iter__(self) -> Iterator[List[Dict[str, any]]]:
+        page = []
+        for game in iter_games_file(self.path):
+            page.append(game)
+            if len(page) == self.page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+
+def read_watermark(storage) -> Optional[Dict[str, any]]:
+    stored = storage.get(config.WATERMARK_KEY)
+    if stored is None:
+        return None
+    return json.loads(stored.read())
+
+
+def write_watermark(storage, watermark: Dict[str, any]) -> None:
+    storage.put(config.WATERMARK_KEY, json.dumps(watermark).encode("utf-8"))
+
+
+def download_history(storage, path: str) -> bool:
+    """Streams the stored history to `path`, returns False if there is none."""
+    return storage.get_file(config.GAMES_HISTORY_KEY, path)
+
+
+def upload_history(storage, path: str) -> None:
+    storage.put_file(path, config.GAMES_HISTORY_KEY)
@@ -1,26 +1,75 @@
+import hashlib
+import json
 import os
-from io import StringIO
-from typing import List
+from typing import Dict, Optional
 
-import boto3
 import pandas as pd
+import prefect
+from config import config
 from prefect import task
 
+from scripts.artifacts import (
+    get_storage,
+    upload_if_changed,
+    write_csv_gzip,
+    write_dataset,
+)
+from scripts.history import spool_path
+from scripts.rolling_state import RollingState, write_rolling_state
+
 
 @task
-def load(df: pd.DataFrame, file_name: str) -> None:
-    s3_bucket = os.environ.get("S3_BUCKET")
-    if not s3_bucket:
-        raise ValueError("S3_BUCKET environment variable not set")
+def load(df: pd.DataFrame, file_name: str) -> bool:
+    """Uploads `df` in the configured format, unless the stored artifact already
+    has the same content. Returns whether anything was uploaded."""
+    storage = get_storage()
+
+    if config.ARTIFACT_FORMAT == "parquet":
+        uploaded = write_dataset(storage, file_name, df)
+    elif config.ARTIFACT_FORMAT == "csv":
+        # Gzipped CSV spooled to a file, so large sets go up in parts
+        path = spool_path(f"{file_name}.csv.gz")
+        fingerprint = write_csv_gzip(df, path)
+        with open(path, "rb") as body:
+            uploaded = upload_if_changed(
+                storage,
+                f"{file_name}.csv",
+                body,
+                fingerprint,
+                content_type="text/csv",
+                content_encoding="gzip",
+            )
+        os.remove(path)
+    else:
+        raise ValueError(f"Unknown ARTIFACT_FORMAT: {config.ARTIFACT_FORMAT}")
 
-    s3_client = boto3.client("s3")
+    prefect.context.get("logger").info(
+        f"{file_name}: {'uploaded' if uploaded else 'unchanged, upload skipped'}"
+    )
+    return uploaded
 
-    # Convert DataFrame to CSV in memory
-    csv_buffer_games = StringIO()
-    df.to_csv(csv_buffer_games, index=False)
-    csv_buffer_games.seek(0)  # Rewind the buffer
 
-    # Upload to S3
-    s3_client.put_object(
-        Bucket=s3_bucket, Key=f"{file_name}.csv", Body=csv_buffer_games.getvalue()
+@task
+def save_rolling_state(rolling_state: Optional[RollingState]) -> None:
+    """Persists the rolling state, once the training set built with it is loaded."""
+    if rolling_state is None:
+        return
+
+    write_rolling_state(get_storage(), rolling_state)
+
+
+@task
+def save_team_index(team_index: Dict[str, any]) -> bool:
+    """Uploads the per-team feature index, unless it didn't change."""
+    body = json.dumps(team_index).encode("utf-8")
+    uploaded = upload_if_changed(
+        get_storage(),
+        config.TEAM_INDEX_KEY,
+        body,
+        hashlib.sha256(body).hexdigest(),
+        content_type="application/json",
+    )
+    prefect.context.get("logger").info(
+        f"{config.TEAM_INDEX_KEY}: {'uploaded' if uploaded else 'unchanged, upload skipped'}"
     )
+    return uploaded
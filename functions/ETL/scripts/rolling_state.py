@@ -0,0 +1,202 @@
+import copy
+import json
+import math
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from config import config
+from pandas import DataFrame
+
+from common.datasets import read_csv
+from scripts.artifacts import read_dataset
+from scripts.history import pending_cutoff
+
+
+class RollingState:
+    """Last `max(windows)` values of the rolling columns for every team, plus the
+    cursor of the last game folded in.
+
+    Only the frozen prefix of the history is persisted: the games up to the
+    first one that may still change, that is neither final nor stale (see
+    `pending_cutoff`). The IDs of the stale games folded in are kept, so the
+    state is rebuilt if one of them turns final after all.
+
+    Every team also has the running sums of each window, so a mean costs
+    O(1) per window instead of a pass over its values.
+    """
+
+    def __init__(self, windows: List[int], columns: List[str]) -> None:
+        self.windows = list(windows)
+        self.columns = list(columns)
+        self.max_window = max(windows)
+        self.teams: Dict[str, deque] = {}
+        # Flat window × column running sums, and counts of NaN values
+        self.sums: Dict[str, List[float]] = {}
+        self.nans: Dict[str, List[int]] = {}
+        self.cursor: Optional[Tuple[pd.Timestamp, int]] = None
+        self.frozen_games = 0
+        self.stale_ids: List[int] = []
+
+    def matches(self, windows: List[int], columns: List[str]) -> bool:
+        return self.windows == list(windows) and self.columns == list(columns)
+
+    def means(self, team: str) -> List[float]:
+        """Rolling means of every window × column, NaN while the team has fewer
+        games than the window (same as rolling(window, closed="left"))."""
+        games = len(self.teams.get(team, ()))
+        if not games:
+            return [np.nan] * (len(self.windows) * len(self.columns))
+        sums, nans = self.sums[team], self.nans[team]
+        means = []
+        for k, window in enumerate(self.windows):
+            for j in range(k * len(self.columns), (k + 1) * len(self.columns)):
+                means.append(
+                    np.nan if games < window or nans[j] else sums[j] / window
+                )
+        return means
+
+    def fold(self, team: str, values: Tuple[float, ...]) -> None:
+        if team not in self.teams:
+            self.teams[team] = deque(maxlen=self.max_window)
+            self.sums[team] = [0.0] * (len(self.windows) * len(self.columns))
+            self.nans[team] = [0] * (len(self.windows) * len(self.columns))
+        history = self.teams[team]
+        sums, nans = self.sums[team], self.nans[team]
+        for k, window in enumerate(self.windows):
+            # The values leaving the window as `values` enter it
+            leaving = history[len(history) - window] if len(history) >= window else None
+            for i in range(len(self.columns)):
+                j = k * len(self.columns) + i
+                if math.isnan(values[i]):
+                    nans[j] += 1
+                else:
+                    sums[j] += values[i]
+                if leaving is not None:
+                    if math.isnan(leaving[i]):
+                        nans[j] -= 1
+                    else:
+                        sums[j] -= leaving[i]
+        history.append(values)
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "windows": self.windows,
+                "columns": self.columns,
+                "cursor": {"date": self.cursor[0].isoformat(), "id": self.cursor[1]}
+                if self.cursor
+                else None,
+                "frozen_games": self.frozen_games,
+                "stale_ids": self.stale_ids,
+                "teams": {team: list(values) for team, values in self.teams.items()},
+            }
+        )
+
+    @classmethod
+    def from_json(cls, body: str) -> "RollingState":
+        data = json.loads(body)
+        state = cls(data["windows"], data["columns"])
+        if data["cursor"]:
+            state.cursor = (pd.Timestamp(data["cursor"]["date"]), data["cursor"]["id"])
+        state.frozen_games = data["frozen_games"]
+        state.stale_ids = data.get("stale_ids", [])
+        for team, values in data["teams"].items():
+            for value in values:
+                state.fold(team, tuple(value))
+        return state
+
+
+def is_before_cursor(
+    dates: pd.Series, ids: pd.Series, cursor: Optional[Tuple[pd.Timestamp, int]]
+) -> pd.Series:
+    """Rows whose (date, id) is at or before the cursor."""
+    if cursor is None:
+        return pd.Series(False, index=dates.index)
+    cursor_date, cursor_id = cursor
+    return (dates < cursor_date) | ((dates == cursor_date) & (ids <= cursor_id))
+
+
+def apply_rolling_state(
+    df: DataFrame, state: RollingState, columns: List[str]
+) -> Tuple[DataFrame, RollingState, pd.Series]:
+    """Fills the moving averages of the rows after the state's cursor, folding
+    them into the state on the way, in O(new rows).
+
+    `df` is the home/away frame sorted by date and id. Rows of the frozen prefix
+    are left NaN and returned as a mask: their features were already published.
+    If the prefix doesn't match the state anymore (games removed, a stale game
+    turned final, config changed), the state is rebuilt from the whole history.
+    """
+    frozen = is_before_cursor(df["date"], df["id"], state.cursor)
+    turned_final = df["is_final"] & df["id"].isin(state.stale_ids)
+    if (
+        not state.matches(config.MOVING_AVERAGE_WINDOWS, columns)
+        or df.loc[frozen, "id"].nunique() != state.frozen_games
+        or (frozen & turned_final).any()
+    ):
+        state = RollingState(config.MOVING_AVERAGE_WINDOWS, columns)
+        frozen = pd.Series(False, index=df.index)
+
+    tail = df[~frozen]
+    features = np.full(
+        (len(tail), len(state.windows) * len(columns)), np.nan, dtype="float64"
+    )
+    teams = tail[config.TEAM_NAME_COLUMN].to_numpy()
+    ids = tail["id"].to_numpy()
+    dates = tail["date"]
+    values = tail[columns].to_numpy(dtype="float64")
+    final = tail["is_final"].to_numpy()
+    stale = (dates < pd.Timestamp(pending_cutoff(), tz="UTC")).to_numpy()
+
+    # Rows are folded into `state` until the first game that can still change;
+    # from there on a copy keeps going so later rows still see the earlier ones
+    persistent_state = None
+    last_id = None
+    for i in range(len(tail)):
+        row_values = tuple(values[i])
+        if persistent_state is None and not (final[i] or stale[i]):
+            persistent_state = copy.deepcopy(state)
+        features[i] = state.means(teams[i])
+        state.fold(teams[i], row_values)
+        if persistent_state is None and ids[i] != last_id:
+            state.cursor = (dates.iloc[i], int(ids[i]))
+            state.frozen_games += 1
+            if not final[i]:
+                state.stale_ids.append(int(ids[i]))
+        last_id = ids[i]
+
+    df = df.copy()
+    feature_names = [
+        f"avg_last_{window}_{col}" for window in state.windows for col in columns
+    ]
+    tail_rows = ~frozen.to_numpy()
+    for j, name in enumerate(feature_names):
+        column = np.full(len(df), np.nan, dtype=config.FEATURE_DTYPE)
+        column[tail_rows] = features[:, j]
+        df[name] = column
+    return df, persistent_state or state, frozen
+
+
+def read_rolling_state(storage) -> Optional[RollingState]:
+    stored = storage.get(config.ROLLING_STATE_KEY)
+    if stored is None:
+        return None
+    return RollingState.from_json(stored.read())
+
+
+def write_rolling_state(storage, state: RollingState) -> None:
+    storage.put(config.ROLLING_STATE_KEY, state.to_json().encode("utf-8"))
+
+
+def read_published_train(storage) -> Optional[DataFrame]:
+    """Reads the training set published by the previous run."""
+    if config.ARTIFACT_FORMAT == "parquet":
+        return read_dataset(storage, config.TRAIN_FILE_NAME)
+
+    df = read_csv(storage, f"{config.TRAIN_FILE_NAME}.csv")
+    if df is None:
+        return None
+    df["home_date"] = pd.to_datetime(df["home_date"], utc=True)
+    return df
@@ -1,10 +1,55 @@
 from datetime import datetime, timezone
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 from config import config
 from pandas import DataFrame
 from prefect import task
+from prefect.utilities.logging import get_logger
+
+from scripts.artifacts import get_storage
+from scripts.columns import ColumnStore
+from scripts.rolling_state import (
+    RollingState,
+    apply_rolling_state,
+    is_before_cursor,
+    read_published_train,
+    read_rolling_state,
+)
+
+logger = get_logger("transform")
+
+TEAM_INDEX_FORMAT_VERSION = 1
+
+
+def policy_dtype(col: str) -> Optional[str]:
+    """Dtype the policy assigns to a column, by name, whatever the stage."""
+    if col == "id":
+        return config.ID_DTYPE
+    if "_avg_last_" in col or col.startswith("avg_last_"):
+        return config.FEATURE_DTYPE
+    if col.endswith("team_abbreviation"):
+        return config.TEAM_DTYPE
+    if col.endswith("_score"):
+        return config.SCORE_DTYPE
+    return None
+
+
+def apply_dtype_policy(df: DataFrame) -> DataFrame:
+    """Casts the columns that drifted from the dtype policy, e.g. after a concat
+    with data read back from a CSV."""
+    for col in df.columns:
+        dtype = policy_dtype(col)
+        if dtype is not None and str(df[col].dtype) != dtype:
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+def report_memory(stage: str, *dfs: DataFrame) -> None:
+    """Logs the memory used by the DataFrames of a stage."""
+    n_bytes = sum(int(df.memory_usage(deep=True).sum()) for df in dfs)
+    logger.info(f"Memory after {stage}: {n_bytes / 2**20:.1f} MiB")
 
 
 def flatten_dict(
@@ -27,6 +72,93 @@ def pre_select_features(df: DataFrame) -> DataFrame:
     return df[features]
 
 
+def feature_paths(
+    game: Dict[str, any], features: List[str] = None, sep: str = "_"
+) -> Dict[str, Tuple[str, ...]]:
+    """Maps each pre-selected feature to its key path in a raw game, following the
+    same naming as flatten_dict (e.g. home_team_abbreviation -> home_team/abbreviation)."""
+    features = features or config.PRE_SELECTED_FEATURES
+    paths = {}
+
+    def walk(d: Dict[str, any], parent_path: Tuple[str, ...]) -> None:
+        for k, v in d.items():
+            path = parent_path + (k,)
+            if isinstance(v, Dict):
+                walk(v, path)
+            else:
+                paths[sep.join(path)] = path
+
+    walk(game, ())
+    missing = [feature for feature in features if feature not in paths]
+    if missing:
+        raise KeyError(f"Features not found in the games data: {missing}")
+    return {feature: paths[feature] for feature in features}
+
+
+def extract_column(games: List[Dict[str, any]], path: Tuple[str, ...]) -> list:
+    """Pulls the values at `path` out of every game."""
+    if len(path) == 1:
+        (key,) = path
+        return [game.get(key) for game in games]
+    if len(path) == 2:
+        parent, key = path
+        return [game[parent].get(key) for game in games]
+    values = games
+    for key in path[:-1]:
+        values = [value[key] for value in values]
+    return [value.get(path[-1]) for value in values]
+
+
+def build_columns(
+    games: List[Dict[str, any]], paths: Dict[str, Tuple[str, ...]]
+) -> Dict[str, list]:
+    """Columnar alternative to flattening every game: only the selected paths
+    are visited, one list comprehension per column."""
+    return {feature: extract_column(games, path) for feature, path in paths.items()}
+
+
+def page_to_columns(
+    games: List[Dict[str, any]], paths: Dict[str, Tuple[str, ...]] = None
+) -> Dict[str, np.ndarray]:
+    """Converts a page of games into typed columns of the pre-selected features."""
+    raw_columns = build_columns(games, paths or feature_paths(games[0]))
+    columns = {}
+    for name, dtype in config.COLUMN_DTYPES.items():
+        if name == "is_final":
+            columns[name] = np.array(
+                [status == config.FINAL_GAME_STATUS for status in raw_columns["status"]],
+                dtype=dtype,
+            )
+            continue
+        values = raw_columns[name]
+        if name == "date":
+            # Naive UTC timestamps, correct_dtypes localizes them
+            dates = pd.to_datetime(values, utc=True).tz_localize(None)
+            columns[name] = dates.to_numpy(dtype)
+        elif name.endswith("_score"):
+            # Games not played yet may come without a score
+            scores = np.array(values, dtype="float64")
+            columns[name] = np.nan_to_num(scores, nan=0).astype(dtype)
+        elif dtype == "category":
+            # Encoded by the column store, against a vocabulary shared by columns
+            columns[name] = np.array(values, dtype=object)
+        else:
+            columns[name] = np.array(values, dtype=dtype)
+    return columns
+
+
+def games_to_dataframe(games_pages: Iterable[List[Dict[str, any]]]) -> DataFrame:
+    """Builds the pre-selected features DataFrame one page at a time, so only a
+    page of raw games is held in memory at once."""
+    columns = ColumnStore(config.COLUMN_DTYPES)
+    paths = None
+    for games in games_pages:
+        if games:
+            paths = paths or feature_paths(games[0])
+            columns.append(page_to_columns(games, paths))
+    return columns.to_frame()
+
+
 def correct_dtypes(df: DataFrame) -> DataFrame:
     """Converts 'date' column to datetime format."""
     df["date"] = pd.to_datetime(df["date"]).dt.tz_localize('UTC')
@@ -65,24 +197,182 @@ def join_and_sort_dataframes(
     return pd.concat([home_teams_df, away_teams_df], axis=0).sort_values(["date", "id"])
 
 
-def calculate_moving_average_of_num_columns(df: DataFrame) -> DataFrame:
-    """Calculates moving averages for numeric columns."""
+def interleave(home: pd.Series, away: pd.Series) -> pd.Series:
+    """Alternates the values of two aligned columns: home[0], away[0], home[1]..."""
+    n_rows = len(home)
+    if isinstance(home.dtype, np.dtype) and home.dtype == away.dtype:
+        values = np.empty(2 * n_rows, dtype=home.dtype)
+        values[0::2] = home.to_numpy()
+        values[1::2] = away.to_numpy()
+        return pd.Series(values)
+
+    # Extension dtypes (tz-aware dates, categoricals) go through pandas
+    order = np.empty(2 * n_rows, dtype="int64")
+    order[0::2] = np.arange(n_rows)
+    order[1::2] = np.arange(n_rows, 2 * n_rows)
+    values = pd.concat([home, away], ignore_index=True)
+    return values.take(order).reset_index(drop=True)
+
+
+def interleave_home_and_away(df: DataFrame) -> DataFrame:
+    """Builds the home/away frame straight from the games: the games are sorted by
+    date and id, then row 2i is the home side of game i and row 2i + 1 its away
+    side. Same rows as duplicate_dataframe + join_and_sort_dataframes, with no
+    intermediate copies."""
+    df = df.sort_values(["date", "id"])
+    home_columns = {
+        "home_team_abbreviation": "team_abbreviation",
+        "visitor_team_abbreviation": "opponent_team_abbreviation",
+        "home_team_score": "team_score",
+        "visitor_team_score": "opponent_score",
+    }
+    away_sources = {
+        "team_abbreviation": "visitor_team_abbreviation",
+        "opponent_team_abbreviation": "home_team_abbreviation",
+        "team_score": "visitor_team_score",
+        "opponent_score": "home_team_score",
+    }
+    columns = {}
+    for col in df.columns:
+        name = home_columns.get(col, col)
+        columns[name] = interleave(df[col], df[away_sources.get(name, col)])
+    columns["is_home"] = np.tile(np.array([1, 0], dtype="int64"), len(df))
+    return pd.DataFrame(columns)
+
+
+def select_cols_to_iterate(df: DataFrame) -> List[str]:
+    """Selects the numeric columns to calculate moving averages for."""
+    num_cols = list(df.select_dtypes("number").columns)
+    exclude_cols = ["is_home", "id", "date"]
+    return [
+        col
+        for col in num_cols
+        if col not in exclude_cols
+        and col not in (config.TEAM_NAME_COLUMN, config.OPPONENT_TEAM_COLUMN)
+    ]
+
 
-    def select_cols_to_iterate(df: DataFrame) -> List[str]:
-        num_cols = list(df.select_dtypes("number").columns)
-        exclude_cols = ["is_home", "id", "date"]
-        return [col for col in num_cols if col not in exclude_cols]
+def rolling_means(
+    values: np.ndarray, group_codes: np.ndarray, windows: List[int]
+) -> Dict[int, np.ndarray]:
+    """Means of the previous `window` rows of each group, for every window and
+    column at once (same as rolling(window, closed="left").mean() per group).
 
+    Rows are stably sorted by group once, so they stay in chronological order
+    within each group, and every window is a difference of one cumulative sum.
+    Integer columns are summed as int64, so their sums are exact.
+    """
+    n_rows = len(values)
+    order = np.argsort(group_codes, kind="stable")
+    sorted_codes = group_codes[order]
+    sorted_values = values[order]
+
+    # Position of each row within its group
+    starts = np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]
+    start_index = np.maximum.accumulate(np.where(starts, np.arange(n_rows), 0))
+    position = np.arange(n_rows) - start_index
+
+    if np.issubdtype(sorted_values.dtype, np.integer):
+        sums = np.cumsum(sorted_values, axis=0, dtype="int64")
+        nans = None
+    else:
+        is_nan = np.isnan(sorted_values)
+        sums = np.cumsum(np.where(is_nan, 0, sorted_values), axis=0)
+        nans = np.cumsum(is_nan, axis=0)
+    zeros = np.zeros((1, values.shape[1]), dtype=sums.dtype)
+    sums = np.vstack([zeros, sums])
+    if nans is not None:
+        nans = np.vstack([zeros.astype(nans.dtype), nans])
+
+    means = {}
+    rows = np.arange(n_rows)
+    for window in windows:
+        # Window of row i is rows [i - window, i - 1], all in the same group
+        full = position >= window
+        lower = np.where(full, rows - window, 0)
+        window_means = (sums[rows] - sums[lower]) / window
+        window_means[~full] = np.nan
+        if nans is not None:
+            window_means[(nans[rows] - nans[lower]) > 0] = np.nan
+        unsorted = np.empty_like(window_means, dtype="float64")
+        unsorted[order] = window_means
+        means[window] = unsorted
+    return means
+
+
+def calculate_moving_average_of_num_columns(df: DataFrame) -> DataFrame:
+    """Calculates moving averages for numeric columns."""
     cols_to_iterate = select_cols_to_iterate(df)
+    group_codes, _ = pd.factorize(df[config.TEAM_NAME_COLUMN])
+    values = df[cols_to_iterate].to_numpy()
+    means = rolling_means(values, group_codes, config.MOVING_AVERAGE_WINDOWS)
     for window in config.MOVING_AVERAGE_WINDOWS:
-        for col in cols_to_iterate:
-            if col not in (config.TEAM_NAME_COLUMN, config.OPPONENT_TEAM_COLUMN):
-                df[f"avg_last_{window}_{col}"] = df.groupby(config.TEAM_NAME_COLUMN)[
-                    col
-                ].transform(lambda x: x.rolling(window, closed="left").mean())
+        for j, col in enumerate(cols_to_iterate):
+            df[f"avg_last_{window}_{col}"] = means[window][:, j].astype(
+                config.FEATURE_DTYPE
+            )
     return df
 
 
+def calculate_moving_average_from_state(
+    df: DataFrame,
+) -> Tuple[DataFrame, RollingState, Optional[DataFrame]]:
+    """Calculates moving averages only for the games after the persisted rolling
+    state. Returns the published training rows of the games before it, whose
+    features can't change anymore."""
+    storage = get_storage()
+    columns = select_cols_to_iterate(df)
+    state = read_rolling_state(storage)
+    published_train = read_published_train(storage) if state else None
+    if state is None or published_train is None:
+        state = RollingState(config.MOVING_AVERAGE_WINDOWS, columns)
+
+    previous_cursor = state.cursor
+    df, state, frozen = apply_rolling_state(df, state, columns)
+    if not frozen.any():
+        return df, state, None
+
+    published_train = published_train[
+        is_before_cursor(
+            published_train["home_date"], published_train["id"], previous_cursor
+        )
+    ]
+    return df, state, published_train
+
+
+def build_team_index(df: DataFrame) -> Dict[str, any]:
+    """Latest moving averages of every team, over its final games: the
+    features its next game would get, for every window.
+
+    `df` is the home/away frame. A row is appended after the last game of each
+    team, and its means computed with the training features' code.
+    """
+    columns = select_cols_to_iterate(df)
+    final = df[df["is_final"].to_numpy()]
+    group_codes, teams = pd.factorize(final[config.TEAM_NAME_COLUMN], sort=True)
+    games = np.bincount(group_codes, minlength=len(teams))
+    values = final[columns].to_numpy()
+    next_games = np.zeros((len(teams), len(columns)), dtype=values.dtype)
+    values = np.vstack([values, next_games])
+    group_codes = np.r_[group_codes, np.arange(len(teams))]
+    means = rolling_means(values, group_codes, config.MOVING_AVERAGE_WINDOWS)
+
+    features = {}
+    for window in config.MOVING_AVERAGE_WINDOWS:
+        latest = means[window][-len(teams):].astype(config.FEATURE_DTYPE)
+        for j, col in enumerate(columns):
+            features[f"avg_last_{window}_{col}"] = [
+                None if np.isnan(value) else float(value) for value in latest[:, j]
+            ]
+    return {
+        "format_version": TEAM_INDEX_FORMAT_VERSION,
+        "as_of": final["date"].max().isoformat() if len(final) else None,
+        "teams": [str(team) for team in teams],
+        "games": games.tolist(),
+        "features": features,
+    }
+
+
 def put_games_on_single_row(df: DataFrame) -> DataFrame:
     """Merges home and away team data into a single row per game."""
     home_teams_df = df[df["is_home"] == 1]
@@ -96,6 +386,23 @@ def put_games_on_single_row(df: DataFrame) -> DataFrame:
     return pd.merge(home_teams_df, away_teams_df, on="id")
 
 
+def split_home_and_away(df: DataFrame) -> DataFrame:
+    """Puts each game on a single row from an interleaved home/away frame: home
+    sides are the even rows and away sides the odd ones, so the two halves line
+    up by position and no join is needed."""
+    def side(col: str, start: int):
+        if isinstance(df[col].dtype, np.dtype):
+            return df[col].to_numpy()[start::2]  # strided view, no copy
+        return df[col].iloc[start::2].reset_index(drop=True)
+
+    columns = {"id": side("id", 0)}
+    for prefix, start in (("home_", 0), ("away_", 1)):
+        for col in df.columns:
+            if col != "id":
+                columns[prefix + col] = side(col, start)
+    return pd.DataFrame(columns)
+
+
 def remove_unnecessary_columns(df: DataFrame) -> DataFrame:
     """Keeps only the necessary columns in the DataFrame."""
     features = [
@@ -132,17 +439,75 @@ def separate_games_to_train_and_predict(df: DataFrame) -> Tuple[DataFrame, DataF
     return to_train, to_predict
 
 
-@task
-def transform(games_data: List[Dict[str, any]]) -> Tuple[DataFrame, DataFrame]:
-    """Transforms the DataFrame through a series of predefined steps."""
-    flattened_games = [flatten_dict(game) for game in games_data]
-    df = pd.DataFrame(flattened_games)
-    df = pre_select_features(df)
-    df = correct_dtypes(df)
-    home_teams_df, away_teams_df = duplicate_dataframe(df)
-    df = join_and_sort_dataframes(home_teams_df, away_teams_df)
+def verify_against_full_recompute(
+    df: DataFrame, to_train: DataFrame, to_predict: DataFrame
+) -> None:
+    """Checks the incremental results against a full recompute of `df`, the
+    home/away frame before any moving average was added."""
     df = calculate_moving_average_of_num_columns(df)
     df = put_games_on_single_row(df)
     df = remove_unnecessary_columns(df)
+    expected_train, expected_predict = separate_games_to_train_and_predict(df)
+
+    for name, actual, expected in (
+        ("to_train", to_train, expected_train),
+        ("to_predict", to_predict, expected_predict),
+    ):
+        actual = actual.sort_values(["home_date", "id"]).reset_index(drop=True)
+        expected = expected.sort_values(["home_date", "id"]).reset_index(drop=True)
+        if not np.array_equal(actual["id"], expected["id"]):
+            raise ValueError(f"Incremental {name} doesn't have the expected games")
+        features = [col for col in expected.columns if "_avg_last_" in col]
+        if not np.allclose(
+            actual[features].to_numpy(dtype="float64"),
+            expected[features].to_numpy(dtype="float64"),
+            equal_nan=True,
+        ):
+            raise ValueError(f"Incremental {name} moving averages don't match")
+
+
+@task
+def transform(
+    games_pages: Iterable[List[Dict[str, any]]]
+) -> Tuple[DataFrame, DataFrame, Optional[RollingState], Dict[str, any]]:
+    """Transforms the DataFrame through a series of predefined steps. Also
+    returns the rolling state to persist, and the per-team feature index."""
+    df = games_to_dataframe(games_pages)
+    df = correct_dtypes(df)
+    report_memory("ingestion", df)
+    if config.PAIRING_MODE == "merge":
+        home_teams_df, away_teams_df = duplicate_dataframe(df)
+        df = join_and_sort_dataframes(home_teams_df, away_teams_df)
+    elif config.PAIRING_MODE == "interleaved":
+        df = interleave_home_and_away(df)
+    else:
+        raise ValueError(f"Unknown PAIRING_MODE: {config.PAIRING_MODE}")
+    report_memory("home/away pairing", df)
+    team_index = build_team_index(df)
+
+    rolling_state = published_train = None
+    if config.ROLLING_MODE == "full":
+        df = calculate_moving_average_of_num_columns(df)
+    elif config.ROLLING_MODE in ("incremental", "verify"):
+        games_df = df.copy() if config.ROLLING_MODE == "verify" else None
+        df, rolling_state, published_train = calculate_moving_average_from_state(df)
+    else:
+        raise ValueError(f"Unknown ROLLING_MODE: {config.ROLLING_MODE}")
+    report_memory("moving averages", df)
+
+    if config.PAIRING_MODE == "merge":
+        df = put_games_on_single_row(df)
+    else:
+        df = split_home_and_away(df)
+    report_memory("single row per game", df)
+    df = remove_unnecessary_columns(df)
     to_train, to_predict = separate_games_to_train_and_predict(df)
-    return to_train, to_predict
+    if published_train is not None:
+        to_train = pd.concat([published_train, to_train], ignore_index=True)
+    to_train = apply_dtype_policy(to_train)
+    to_predict = apply_dtype_policy(to_predict)
+    report_memory("train/predict split", to_train, to_predict)
+
+    if config.ROLLING_MODE == "verify":
+        verify_against_full_recompute(games_df, to_train, to_predict)
+    return to_train, to_predict, rolling_state, team_index
@@ -0,0 +1,79 @@
+"""Readers of the to_train/to_predict artifacts published by the ETL: gzipped
+or plain CSV files, and Parquet datasets partitioned by season."""
+import base64
+import json
+from io import BytesIO
+from typing import List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas import DataFrame
+
+
+def read_parquet_dataset(
+    storage, prefix: str, columns: Optional[List[str]] = None, attempts: int = 3
+) -> Optional[DataFrame]:
+    """Reads the partitions listed by the dataset manifest, in season order,
+    decoding only `columns`. None if there is no manifest.
+
+    A writer deletes the partitions its new manifest no longer lists right
+    after swapping it, so a partition of the manifest read here can be gone:
+    the manifest is then read again."""
+    for _ in range(attempts):
+        stored = storage.get(f"{prefix}/_manifest.json")
+        if stored is None:
+            return None
+        manifest = json.loads(stored.read())
+        tables = read_partitions(storage, manifest, columns)
+        if tables is not None:
+            break
+    else:
+        raise FileNotFoundError(f"Partitions of {prefix} kept disappearing while read")
+
+    if not tables:
+        schema = pa.ipc.read_schema(pa.py_buffer(base64.b64decode(manifest["schema"])))
+        tables.append(schema.empty_table().select(columns or schema.names))
+    return pa.concat_tables(tables).to_pandas()
+
+
+def read_partitions(
+    storage, manifest: dict, columns: Optional[List[str]] = None
+) -> Optional[List[pa.Table]]:
+    """Tables of the manifest's partitions, None if one of them is gone."""
+    tables = []
+    for partition in manifest["partitions"]:
+        stored = storage.get(partition["key"])
+        if stored is None:
+            return None
+        body = pa.py_buffer(stored.body)
+        tables.append(pq.read_table(pa.BufferReader(body), columns=columns))
+    return tables
+
+
+def read_csv(storage, key: str, columns: Optional[List[str]] = None) -> Optional[DataFrame]:
+    stored = storage.get(key)
+    if stored is None:
+        return None
+    # The ETL uploads the CSVs gzipped
+    compression = "gzip" if stored.content_encoding == "gzip" else None
+    return pd.read_csv(BytesIO(stored.body), usecols=columns, compression=compression)
+
+
+def version_key(key: str) -> str:
+    """Object whose ETag changes whenever the artifact at `key` does: the
+    manifest of a Parquet dataset, the object itself otherwise."""
+    if key.endswith(".parquet"):
+        return f"{key}/_manifest.json"
+    return key
+
+
+def read_dataframe(storage, key: str, columns: Optional[List[str]] = None) -> DataFrame:
+    """Reads a CSV artifact, or a Parquet dataset when `key` ends with .parquet."""
+    if key.endswith(".parquet"):
+        df = read_parquet_dataset(storage, key, columns)
+    else:
+        df = read_csv(storage, key, columns)
+    if df is None:
+        raise FileNotFoundError(f"{key} not found in the artifacts storage")
+    return df
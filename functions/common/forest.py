@@ -0,0 +1,171 @@
+"""Compact artifact of a trained random forest, written by the training function
+and read by the prediction one.
+
+All the trees are stored as flat arrays behind a JSON header holding the
+format version, the feature and target names, the forest parameters and the
+caller's metadata:
+
+    MAGIC | header length (uint32) | header | arrays, 64-byte aligned
+
+Leaves store their value index in `right`, so only leaves carry values. The
+arrays are read as views of the buffer they come from, a memory map for an
+uncompressed artifact in local storage. Artifacts stored gzip-encoded are
+decompressed once into memory.
+"""
+import gzip
+import json
+import struct
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b"NBAFOREST"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+ARRAYS = ("roots", "left", "right", "feature", "threshold", "leaf_values")
+
+
+class CompactForest:
+    """Predicts like the forest it was exported from, without sklearn."""
+
+    def __init__(self, header: Dict[str, any], arrays: Dict[str, np.ndarray]) -> None:
+        self.header = header
+        self.features: List[str] = header["features"]
+        self.targets: List[str] = header["targets"]
+        self.params: Dict[str, any] = header["params"]
+        self.max_depth: int = header["max_depth"]
+        self.metadata: Dict[str, any] = header.get("metadata", {})
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @property
+    def n_estimators(self) -> int:
+        return len(self.roots)
+
+    def predict(self, X) -> np.ndarray:
+        """Mean of the tree predictions, (samples, targets). All the trees
+        descend one level per step."""
+        if hasattr(X, "columns"):
+            X = X[self.features].to_numpy()
+        # The trees compare float32 features with float64 thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        rows = np.arange(len(X))[:, None]
+
+        nodes = np.repeat(self.roots[None, :], len(X), axis=0)
+        for _ in range(self.max_depth):
+            left = self.left[nodes]
+            internal = left >= 0
+            if not internal.any():
+                break
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(
+                internal, np.where(go_left, left, self.right[nodes]), nodes
+            )
+        return self.leaf_values[self.right[nodes]].mean(axis=1)
+
+
+def export_forest(
+    model,
+    features: List[str],
+    targets: List[str],
+    metadata: Optional[Dict[str, any]] = None,
+) -> Tuple[Dict[str, any], Dict[str, np.ndarray]]:
+    """Flattens the trees of a fitted RandomForestRegressor into global node
+    arrays, and returns them with the header."""
+    roots, lefts, rights, feature, thresholds, values = [], [], [], [], [], []
+    n_nodes = n_leaves = max_depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        is_leaf = tree.children_left < 0
+        leaf_index = np.cumsum(is_leaf) - 1 + n_leaves
+
+        roots.append(n_nodes)
+        lefts.append(np.where(is_leaf, -1, tree.children_left + n_nodes))
+        rights.append(np.where(is_leaf, leaf_index, tree.children_right + n_nodes))
+        feature.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(tree.threshold)
+        values.append(tree.value[is_leaf, :, 0])
+
+        n_nodes += tree.node_count
+        n_leaves += int(is_leaf.sum())
+        max_depth = max(max_depth, tree.max_depth)
+
+    arrays = {
+        "roots": np.array(roots, dtype=np.int32),
+        "left": np.concatenate(lefts).astype(np.int32),
+        "right": np.concatenate(rights).astype(np.int32),
+        "feature": np.concatenate(feature).astype(np.int16),
+        "threshold": np.concatenate(thresholds).astype(np.float64),
+        "leaf_values": np.concatenate(values).astype(np.float64),
+    }
+    header = {
+        "format_version": FORMAT_VERSION,
+        "features": list(features),
+        "targets": list(targets),
+        "params": model.get_params(),
+        "max_depth": int(max_depth),
+        "metadata": metadata or {},
+    }
+    return header, arrays
+
+
+def serialize_forest(
+    model,
+    features: List[str],
+    targets: List[str],
+    metadata: Optional[Dict[str, any]] = None,
+) -> bytearray:
+    header, arrays = export_forest(model, features, targets, metadata)
+    offset = 0
+    header["arrays"] = {}
+    for name in ARRAYS:
+        array = arrays[name]
+        header["arrays"][name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+        }
+        offset = aligned(offset + array.nbytes)
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    start = aligned(len(MAGIC) + 4 + len(header_bytes))
+    buffer = bytearray(start + offset)
+    buffer[: len(MAGIC)] = MAGIC
+    struct.pack_into("<I", buffer, len(MAGIC), len(header_bytes))
+    buffer[len(MAGIC) + 4 : len(MAGIC) + 4 + len(header_bytes)] = header_bytes
+    for name in ARRAYS:
+        array = np.ascontiguousarray(arrays[name])
+        position = start + header["arrays"][name]["offset"]
+        buffer[position : position + array.nbytes] = memoryview(array).cast("B")
+    return buffer
+
+
+def load_forest(buffer, content_encoding: str = None) -> CompactForest:
+    """Reads an artifact from a bytes-like buffer, without copying the arrays
+    unless it is gzip-encoded."""
+    if content_encoding == "gzip":
+        buffer = gzip.decompress(buffer)
+    if bytes(buffer[: len(MAGIC)]) != MAGIC:
+        raise ValueError("Not a forest artifact")
+    (header_length,) = struct.unpack_from("<I", buffer, len(MAGIC))
+    header_end = len(MAGIC) + 4 + header_length
+    header = json.loads(bytes(buffer[len(MAGIC) + 4 : header_end]))
+    if header["format_version"] != FORMAT_VERSION:
+        raise ValueError(
+            f"Forest artifact version {header['format_version']}, "
+            f"expected {FORMAT_VERSION}"
+        )
+
+    start = aligned(header_end)
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"]))
+        arrays[name] = np.frombuffer(
+            buffer, dtype=dtype, count=count, offset=start + spec["offset"]
+        ).reshape(spec["shape"])
+    return CompactForest(header, arrays)
+
+
+def aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
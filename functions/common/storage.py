@@ -0,0 +1,326 @@
+"""Storage of the pipeline artifacts, shared by the ETL, training and prediction
+functions: an S3 bucket, or a local directory for runs and benchmarks that
+shouldn't depend on S3.
+
+Both backends expose the same small object API. The local one serves reads
+through memory maps, so large artifacts (models, Parquet partitions) are
+handed to their readers without being copied.
+"""
+import json
+import mmap
+import os
+import shutil
+import tempfile
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple, Union
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+
+Body = Union[bytes, bytearray, memoryview, BinaryIO]
+
+MISSING_CODES = ("404", "NoSuchKey", "NotFound")
+
+
+class StoredObject:
+    """An object's content and attributes. `body` is a bytes-like buffer (a
+    read-only memory map for the local backend), None for `head` results."""
+
+    def __init__(
+        self,
+        body=None,
+        metadata: Optional[Dict[str, str]] = None,
+        content_encoding: Optional[str] = None,
+        etag: Optional[str] = None,
+        size: Optional[int] = None,
+    ) -> None:
+        self.body = body
+        self.metadata = metadata or {}
+        self.content_encoding = content_encoding
+        self.etag = etag
+        self.size = size
+
+    def read(self) -> bytes:
+        return bytes(self.body)
+
+
+class S3Storage:
+    def __init__(
+        self,
+        bucket: str,
+        s3_client=None,
+        multipart_threshold: int = 8 * 1024 * 1024,
+        multipart_chunksize: int = 8 * 1024 * 1024,
+    ) -> None:
+        self.bucket = bucket
+        self.s3_client = s3_client or boto3.client("s3")
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+        )
+
+    def get(self, key: str) -> Optional[StoredObject]:
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=key)
+        except ClientError as error:
+            if error.response["Error"]["Code"] in MISSING_CODES:
+                return None
+            raise
+        return StoredObject(
+            body=response["Body"].read(),
+            metadata=response.get("Metadata"),
+            content_encoding=response.get("ContentEncoding"),
+            etag=response.get("ETag"),
+            size=response.get("ContentLength"),
+        )
+
+    def head(self, key: str) -> Optional[StoredObject]:
+        try:
+            response = self.s3_client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as error:
+            if error.response["Error"]["Code"] in MISSING_CODES:
+                return None
+            raise
+        return StoredObject(
+            metadata=response.get("Metadata"),
+            content_encoding=response.get("ContentEncoding"),
+            etag=response.get("ETag"),
+            size=response.get("ContentLength"),
+        )
+
+    def put(
+        self,
+        key: str,
+        body: Body,
+        metadata: Optional[Dict[str, str]] = None,
+        content_type: Optional[str] = None,
+        content_encoding: Optional[str] = None,
+    ) -> None:
+        """Uploads bytes or a file object, in parts above the multipart threshold."""
+        if isinstance(body, (bytes, bytearray, memoryview)):
+            body = BytesReader(body)
+        self.s3_client.upload_fileobj(
+            body,
+            self.bucket,
+            key,
+            ExtraArgs=extra_args(metadata, content_type, content_encoding),
+            Config=self.transfer_config,
+        )
+
+    def put_file(
+        self,
+        path: str,
+        key: str,
+        metadata: Optional[Dict[str, str]] = None,
+        content_type: Optional[str] = None,
+        content_encoding: Optional[str] = None,
+    ) -> None:
+        self.s3_client.upload_file(
+            path,
+            self.bucket,
+            key,
+            ExtraArgs=extra_args(metadata, content_type, content_encoding),
+            Config=self.transfer_config,
+        )
+
+    def get_file(self, key: str, path: str) -> bool:
+        """Streams the object to `path`, returns False if it doesn't exist."""
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=key)
+        except ClientError as error:
+            if error.response["Error"]["Code"] in MISSING_CODES:
+                return False
+            raise
+        with open(path, "wb") as file:
+            shutil.copyfileobj(response["Body"], file)
+        return True
+
+    def delete(self, key: str) -> None:
+        self.s3_client.delete_object(Bucket=self.bucket, Key=key)
+
+    def list(self, prefix: str) -> Iterator[Tuple[str, int, float]]:
+        """(key, size, last modified timestamp) of the objects under `prefix`."""
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                yield obj["Key"], obj["Size"], obj["LastModified"].timestamp()
+
+
+class LocalStorage:
+    """Objects as files under `root`, their attributes in a JSON sidecar under
+    `root/.meta`."""
+
+    META_DIR = ".meta"
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"Key outside of the storage root: {key}")
+        return path
+
+    def meta_path(self, key: str) -> str:
+        return self.path(os.path.join(self.META_DIR, key + ".json"))
+
+    def attributes(self, key: str) -> Optional[StoredObject]:
+        try:
+            stat = os.stat(self.path(key))
+        except FileNotFoundError:
+            return None
+        try:
+            with open(self.meta_path(key)) as file:
+                meta = json.load(file)
+        except FileNotFoundError:
+            meta = {}
+        return StoredObject(
+            metadata=meta.get("metadata"),
+            content_encoding=meta.get("content_encoding"),
+            etag=f"{stat.st_mtime_ns:x}-{stat.st_size:x}",
+            size=stat.st_size,
+        )
+
+    def get(self, key: str) -> Optional[StoredObject]:
+        stored = self.attributes(key)
+        if stored is None:
+            return None
+        if stored.size == 0:
+            stored.body = b""
+            return stored
+        with open(self.path(key), "rb") as file:
+            # The map stays valid after the file is closed
+            stored.body = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return stored
+
+    def head(self, key: str) -> Optional[StoredObject]:
+        return self.attributes(key)
+
+    def write_meta(
+        self,
+        key: str,
+        metadata: Optional[Dict[str, str]],
+        content_type: Optional[str],
+        content_encoding: Optional[str],
+    ) -> None:
+        meta = {
+            "metadata": metadata or {},
+            "content_type": content_type,
+            "content_encoding": content_encoding,
+        }
+        atomic_write(self.meta_path(key), json.dumps(meta).encode("utf-8"))
+
+    def put(
+        self,
+        key: str,
+        body: Body,
+        metadata: Optional[Dict[str, str]] = None,
+        content_type: Optional[str] = None,
+        content_encoding: Optional[str] = None,
+    ) -> None:
+        atomic_write(self.path(key), body)
+        self.write_meta(key, metadata, content_type, content_encoding)
+
+    def put_file(
+        self,
+        path: str,
+        key: str,
+        metadata: Optional[Dict[str, str]] = None,
+        content_type: Optional[str] = None,
+        content_encoding: Optional[str] = None,
+    ) -> None:
+        with open(path, "rb") as file:
+            self.put(key, file, metadata, content_type, content_encoding)
+
+    def get_file(self, key: str, path: str) -> bool:
+        try:
+            shutil.copyfile(self.path(key), path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def delete(self, key: str) -> None:
+        for path in (self.path(key), self.meta_path(key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def list(self, prefix: str) -> Iterator[Tuple[str, int, float]]:
+        for directory, subdirectories, files in os.walk(self.root):
+            if directory == self.root:
+                subdirectories[:] = [d for d in subdirectories if d != self.META_DIR]
+            for name in files:
+                path = os.path.join(directory, name)
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if key.startswith(prefix) and not name.endswith(".tmp"):
+                    stat = os.stat(path)
+                    yield key, stat.st_size, stat.st_mtime
+
+
+class BytesReader:
+    """Minimal file object over a buffer, read without copying it first."""
+
+    def __init__(self, buffer) -> None:
+        self.view = memoryview(buffer).cast("B")
+        self.position = 0
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self.view) if size is None or size < 0 else self.position + size
+        data = self.view[self.position : end].tobytes()
+        self.position += len(data)
+        return data
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        base = {0: 0, 1: self.position, 2: len(self.view)}[whence]
+        self.position = base + offset
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+
+def extra_args(
+    metadata: Optional[Dict[str, str]],
+    content_type: Optional[str],
+    content_encoding: Optional[str],
+) -> Dict[str, any]:
+    args = {}
+    if metadata:
+        args["Metadata"] = metadata
+    if content_type:
+        args["ContentType"] = content_type
+    if content_encoding:
+        args["ContentEncoding"] = content_encoding
+    return args
+
+
+def atomic_write(path: str, body: Body) -> None:
+    """Writes to a temporary file renamed over `path`, so readers never see a
+    partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as file:
+        if isinstance(body, (bytes, bytearray, memoryview)):
+            file.write(body)
+        else:
+            shutil.copyfileobj(body, file)
+    os.replace(temp_path, path)
+
+
+def create_storage(
+    backend: str = "s3",
+    bucket: Optional[str] = None,
+    root: Optional[str] = None,
+    **s3_options,
+):
+    """Storage for STORAGE_BACKEND: "s3" (the bucket) or "local" (the root directory)."""
+    if backend == "s3":
+        if not bucket:
+            raise ValueError("S3_BUCKET environment variable not set")
+        return S3Storage(bucket, **s3_options)
+    if backend == "local":
+        if not root:
+            raise ValueError("LOCAL_STORAGE_DIR environment variable not set")
+        return LocalStorage(root)
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
@@ -6,9 +6,26 @@ from typing import List
 @dataclass
 class AppConfig:
     S3_BUCKET: str = os.getenv("S3_BUCKET")
-    TRAIN_FILE_NAME: str = os.getenv("TRAIN_FILE_NAME")
+    # Where the artifacts live: "s3" (S3_BUCKET) or "local" (LOCAL_STORAGE_DIR)
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "s3")
+    LOCAL_STORAGE_DIR: str = os.getenv("LOCAL_STORAGE_DIR")
     PREDICT_FILE_NAME: str = os.getenv("PREDICT_FILE_NAME")
-    ML_MODEL_FILE: str = os.getenv("ML_MODEL_FILE")
+    # Compact artifact of the forest, written by the training function
+    ML_FOREST_FILE: str = os.getenv("ML_FOREST_FILE", "best_model.forest")
+    # Evaluation of the model, written by the training function
+    METRICS_FILE: str = os.getenv("METRICS_FILE", "metrics.json")
+    # Predictions precomputed by the snapshot stage, served as they are stored
+    SNAPSHOT_FILE: str = os.getenv("SNAPSHOT_FILE", "predictions.json")
+    # How long a warm container trusts the versions of the snapshot's sources
+    # before reading them again: new artifacts are served at most that late,
+    # or as soon as the snapshot stage rewrites the snapshot
+    SOURCE_VERSIONS_MAX_AGE_SECONDS: float = float(
+        os.getenv("SOURCE_VERSIONS_MAX_AGE_SECONDS", "60")
+    )
+    # Latest moving averages of every team, written by the ETL
+    TEAM_INDEX_FILE: str = os.getenv("TEAM_INDEX_FILE", "team_index.json")
+    # Largest number of matchups of a batch request
+    MAX_BATCH_MATCHUPS: int = int(os.getenv("MAX_BATCH_MATCHUPS", "1000"))
     FEATURES: List[str] = field(
         default_factory=lambda: [
             "home_avg_last_5_team_score",
@@ -1,77 +1,292 @@
 import os
+import base64
 import json
-import pickle
-from io import BytesIO
+import time
+from datetime import datetime, timezone
+
 import numpy as np
 import pandas as pd
-import boto3
-from sklearn.metrics import mean_squared_error
-from sklearn.base import clone  # Used to copy the original model
 
+from common.datasets import read_dataframe, version_key
+from common.forest import load_forest
+from common.storage import create_storage
 from config import config
 
-s3_client = boto3.client("s3")
+METRICS_FORMAT_VERSION = 2
+SNAPSHOT_FORMAT_VERSION = "1"
+# Version recorded for an artifact that isn't published yet
+MISSING_VERSION = "missing"
+TEAM_INDEX_FORMAT_VERSION = 1
 
-def load_model_from_s3(bucket, model_key):
-    response = s3_client.get_object(Bucket=bucket, Key=model_key)
-    model_str = response["Body"].read()
-    return pickle.loads(model_str)
+_storage = None
 
-def load_dataframe_from_s3(bucket, file_key):
-    response = s3_client.get_object(Bucket=bucket, Key=file_key)
-    df_str = response["Body"].read()
-    return pd.read_csv(BytesIO(df_str))
+def get_storage():
+    global _storage
+    if _storage is None:
+        _storage = create_storage(
+            config.STORAGE_BACKEND, bucket=config.S3_BUCKET, root=config.LOCAL_STORAGE_DIR
+        )
+    return _storage
 
-def calculate_rmse(predictions, actuals):
-    mse = mean_squared_error(actuals, predictions)
-    return np.sqrt(mse)
+def get_artifact(key):
+    stored = get_storage().get(key)
+    if stored is None:
+        raise FileNotFoundError(f"{key} not found in the artifacts storage")
+    return stored
 
-def build_response(response_body):
-    return {
-        "isBase64Encoded": False,
-        "statusCode": 200,
-        "headers": {"Content-Type": "application/json"},
-        "body": response_body,
-    }
+def load_model(model_key):
+    # Arrays read straight from the stored buffer (a memory map for local storage)
+    stored = get_artifact(model_key)
+    model = load_forest(stored.body, stored.content_encoding)
+    if model.features != config.FEATURES:
+        raise ValueError(f"{model_key} was trained on other features: {model.features}")
+    return model
 
-def handler(event, context):
-    bucket = config.S3_BUCKET
-    model_key = config.ML_MODEL_FILE
-    dataframe_key = config.PREDICT_FILE_NAME
-    train_file_key = config.TRAIN_FILE_NAME
-    features = config.FEATURES
-    target_columns = config.TARGET
+def load_dataframe(file_key, columns=None):
+    return read_dataframe(get_storage(), file_key, columns)
+
+def load_metrics(metrics_key):
+    stored = get_artifact(metrics_key)
+    metrics = json.loads(stored.read())
+    if metrics["format_version"] != METRICS_FORMAT_VERSION:
+        raise ValueError(f"{metrics_key} has format version {metrics['format_version']}")
+    return metrics
+
+class BadRequest(ValueError):
+    """Batch request that can't be answered, reported with a 400."""
+
+class TeamIndex:
+    """Latest moving averages of every team, published by the ETL, as a matrix
+    with a row per team and a column per feature."""
+
+    def __init__(self, document):
+        self.as_of = document["as_of"]
+        self.teams = pd.Index(document["teams"])
+        self.columns = pd.Index(list(document["features"]))
+        # Teams with fewer games than a window have None, read as NaN
+        self.values = np.array(
+            [document["features"][column] for column in self.columns], dtype=np.float64
+        ).T
+
+    def features(self, home_teams, away_teams):
+        """FEATURES matrix of the matchups: a `home_` feature is the home team's
+        latest value, an `away_` one the away team's."""
+        teams = {"home": np.asarray(home_teams), "away": np.asarray(away_teams)}
+        rows = {side: self.teams.get_indexer(names) for side, names in teams.items()}
+        unknown = set()
+        for side in teams:
+            unknown.update(teams[side][rows[side] < 0])
+        if unknown:
+            raise BadRequest(f"Unknown teams: {sorted(unknown)}")
+
+        matrix = np.empty((len(teams["home"]), len(config.FEATURES)), dtype=np.float32)
+        for j, feature in enumerate(config.FEATURES):
+            side, column = feature.split("_", 1)
+            matrix[:, j] = self.values[rows[side], self.columns.get_loc(column)]
+        incomplete = np.isnan(matrix).any(axis=1)
+        if incomplete.any():
+            matchups = sorted(
+                {f"{home} vs {away}" for home, away in zip(
+                    teams["home"][incomplete], teams["away"][incomplete]
+                )}
+            )
+            raise BadRequest(f"Not enough games played for: {matchups}")
+        return matrix
+
+def load_team_index(index_key):
+    stored = get_artifact(index_key)
+    document = json.loads(stored.read())
+    if document["format_version"] != TEAM_INDEX_FORMAT_VERSION:
+        raise ValueError(f"{index_key} has format version {document['format_version']}")
+    return TeamIndex(document)
+
+class ArtifactCache:
+    """Artifacts loaded by earlier invocations of a warm container. Each one is
+    reused while the ETag of its version object is unchanged, which costs a
+    HEAD request instead of a download."""
+
+    def __init__(self):
+        self.entries = {}
+        # Versions of the snapshot's sources, and when they were read
+        self.versions = None
+        self.versions_read_at = 0.0
+        self.hits = self.misses = self.reloads = 0
+        self.check_seconds = self.load_seconds = 0.0
+
+    def head(self, key):
+        start = time.perf_counter()
+        stored = get_storage().head(version_key(key))
+        self.check_seconds += time.perf_counter() - start
+        return stored
+
+    def get(self, key, load, columns=None, etag=None):
+        """`etag` is the version already read by the caller, saving the HEAD."""
+        name = (key, tuple(columns or ()))
+        if etag is None:
+            stored = self.head(key)
+            if stored is None:
+                raise FileNotFoundError(f"{key} not found in the artifacts storage")
+            etag = stored.etag
+
+        entry = self.entries.get(name)
+        if entry is not None and entry[0] == etag:
+            self.hits += 1
+            return entry[1]
+
+        start = time.perf_counter()
+        value = load()
+        elapsed = time.perf_counter() - start
+        self.load_seconds += elapsed
+        if entry is None:
+            self.misses += 1
+        else:
+            self.reloads += 1
+        print(f"Loaded {key} in {elapsed:.3f}s ({'reload' if entry else 'miss'})")
+        self.entries[name] = (etag, value)
+        return value
+
+    def stats(self):
+        return (
+            f"{self.hits} hits, {self.misses} misses, {self.reloads} reloads, "
+            f"{self.check_seconds:.3f}s checking, {self.load_seconds:.3f}s loading"
+        )
+
+# Kept across the invocations of a warm container
+artifacts = ArtifactCache()
+
+def cached_model(model_key, etag=None):
+    return artifacts.get(model_key, lambda: load_model(model_key), etag=etag)
+
+def cached_dataframe(file_key, columns=None, etag=None):
+    return artifacts.get(
+        file_key, lambda: load_dataframe(file_key, columns), columns, etag=etag
+    )
+
+def cached_metrics(metrics_key, etag=None):
+    return artifacts.get(metrics_key, lambda: load_metrics(metrics_key), etag=etag)
+
+def cached_team_index(index_key):
+    return artifacts.get(index_key, lambda: load_team_index(index_key))
 
-    # Load the original model (fully trained)
-    original_model = load_model_from_s3(bucket, model_key)
-    df = load_dataframe_from_s3(bucket, dataframe_key)
-    teams_df = df[["home_team_abbreviation", "away_team_abbreviation"]]
-    train_df = load_dataframe_from_s3(bucket, train_file_key)
+def optional_metrics(etag=None):
+    """Metrics of the model, None until the training function publishes them
+    in the current format: the predictions are served without their RMSE
+    meanwhile."""
+    try:
+        if etag == MISSING_VERSION:
+            raise FileNotFoundError(f"{config.METRICS_FILE} not found")
+        return cached_metrics(config.METRICS_FILE, etag)
+    except (FileNotFoundError, ValueError) as error:
+        print(f"{error}, serving the predictions without their RMSE")
+        return None
 
-    # Manually split the training data for time series (75% for training, 25% for testing)
-    split_index = int(len(train_df) * 0.75)
-    train_data = train_df[:split_index]
-    test_data = train_df[split_index:]
+def source_versions(max_age=None):
+    """ETags of the artifacts the predictions are made from, as stored in the
+    metadata of a snapshot. Only the metrics may be missing.
 
-    # Use a copy of the original model for retraining
-    retrain_model = clone(original_model)
+    A warm container reuses the ones it read less than `max_age` seconds ago,
+    so its requests only check the snapshot in between.
+    """
+    if max_age is None:
+        max_age = config.SOURCE_VERSIONS_MAX_AGE_SECONDS
+    if (
+        artifacts.versions is not None
+        and time.monotonic() - artifacts.versions_read_at < max_age
+    ):
+        return artifacts.versions
 
-    # Retrain the model on the first 75% of the training data
-    new_target = train_data[target_columns]#.sum(axis=1)
-    retrain_model.fit(train_data[features], new_target)
+    versions = {}
+    for name, key in (
+        ("model", config.ML_FOREST_FILE),
+        ("games", config.PREDICT_FILE_NAME),
+        ("metrics", config.METRICS_FILE),
+    ):
+        stored = artifacts.head(key)
+        if stored is not None:
+            versions[f"{name}-etag"] = stored.etag
+        elif name == "metrics":
+            versions[f"{name}-etag"] = MISSING_VERSION
+        else:
+            raise FileNotFoundError(f"{key} not found in the artifacts storage")
+    artifacts.versions = versions
+    artifacts.versions_read_at = time.monotonic()
+    return versions
 
-    # Calculate predictions and RMSE on the last 25% test data
-    test_actuals = test_data[target_columns].sum(axis=1)
-    test_predictions = retrain_model.predict(test_data[features]).sum(axis=1)#
-    test_rmse = calculate_rmse(test_predictions, test_actuals)
+def cached_snapshot(versions):
+    """Body of the predictions snapshot, or None when it is missing or was
+    made from other versions of the artifacts."""
+    snapshot_key = config.SNAPSHOT_FILE
+    stored = artifacts.head(snapshot_key)
+    if stored is None:
+        print(f"{snapshot_key} not found")
+        return None
+    expected = dict(versions, **{"format-version": SNAPSHOT_FORMAT_VERSION})
+    if any(stored.metadata.get(name) != value for name, value in expected.items()):
+        print(f"{snapshot_key} was made from other versions of the artifacts")
+        return None
+    return artifacts.get(
+        snapshot_key,
+        lambda: get_artifact(snapshot_key).read().decode("utf-8"),
+        etag=stored.etag,
+    )
+
+def write_snapshot(response_body, versions):
+    get_storage().put(
+        config.SNAPSHOT_FILE,
+        response_body.encode("utf-8"),
+        metadata=dict(versions, **{"format-version": SNAPSHOT_FORMAT_VERSION}),
+        content_type="application/json",
+    )
+    print(f"Wrote {config.SNAPSHOT_FILE} for {versions}")
+
+def predict_games(versions):
+    """Response body with the predictions of the upcoming games."""
+    model_key = config.ML_FOREST_FILE
+    dataframe_key = config.PREDICT_FILE_NAME
+    features = config.FEATURES
+
+    # Load the model (fully trained)
+    original_model = cached_model(model_key, versions["model-etag"])
+    team_columns = ["home_team_abbreviation", "away_team_abbreviation"]
+    df = cached_dataframe(
+        dataframe_key, columns=team_columns + features, etag=versions["games-etag"]
+    )
+    teams_df = df[team_columns]
+
+    # Holdout RMSE, evaluated at training time
+    metrics = optional_metrics(versions["metrics-etag"])
+    model_id = original_model.metadata.get("model_id")
+    if metrics and metrics["model_id"] != model_id:
+        print(f"{config.METRICS_FILE} describes another model than {model_key}")
 
     # Use the original model to predict new data
     new_predictions = original_model.predict(df[features])
 
+    results = format_predictions(
+        teams_df["home_team_abbreviation"], teams_df["away_team_abbreviation"],
+        new_predictions,
+    )
+    return json.dumps({
+        "predictions": results,
+        **rmse_fields(metrics),
+        "model_id": model_id,
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+    })
+
+def rmse_fields(metrics):
+    """Holdout RMSE of the last rebuild of the forest, with the ID of the model
+    it was measured on: the trees added by incremental trainings since then
+    aren't evaluated."""
+    if metrics is None:
+        return {"rmse": None, "rmse_model_id": None}
+    return {
+        "rmse": metrics["rebuild_holdout_rmse"],
+        "rmse_model_id": metrics["rebuild_model_id"],
+    }
+
+def format_predictions(home_teams, away_teams, predictions):
     results = []
-    for i, prediction in enumerate(new_predictions):
-        home_team = teams_df.iloc[i]["home_team_abbreviation"]
-        away_team = teams_df.iloc[i]["away_team_abbreviation"]
+    for home_team, away_team, prediction in zip(home_teams, away_teams, predictions):
         result = {
             home_team: prediction[0],
             away_team: prediction[1],
@@ -79,15 +294,98 @@ def handler(event, context):
             "match": f"{home_team} vs {away_team}"
         }
         results.append(result)
-    response_body = json.dumps({
-        "predictions": results,
-        "rmse": test_rmse
+    return results
+
+def parse_matchups(event):
+    """Home and away teams of a batch request body:
+    {"matchups": [{"home_team": "BOS", "away_team": "LAL"}, ...]}"""
+    body = event.get("body") or ""
+    if event.get("isBase64Encoded"):
+        body = base64.b64decode(body)
+    try:
+        matchups = json.loads(body)["matchups"]
+        home_teams = [matchup["home_team"] for matchup in matchups]
+        away_teams = [matchup["away_team"] for matchup in matchups]
+    except (ValueError, KeyError, TypeError):
+        raise BadRequest(
+            'Expected {"matchups": [{"home_team": ..., "away_team": ...}, ...]}'
+        )
+    if not 0 < len(matchups) <= config.MAX_BATCH_MATCHUPS:
+        raise BadRequest(f"Expected 1 to {config.MAX_BATCH_MATCHUPS} matchups")
+    if not all(isinstance(team, str) for team in home_teams + away_teams):
+        raise BadRequest("Teams must be given by their abbreviation, as strings")
+    if any(home == away for home, away in zip(home_teams, away_teams)):
+        raise BadRequest("A team can't play itself")
+    return home_teams, away_teams
+
+def predict_matchups(event):
+    """Response body with the predictions of the matchups of a batch request,
+    scored in one call from the features of the team index."""
+    home_teams, away_teams = parse_matchups(event)
+    model = cached_model(config.ML_FOREST_FILE)
+    team_index = cached_team_index(config.TEAM_INDEX_FILE)
+    metrics = optional_metrics()
+
+    predictions = model.predict(team_index.features(home_teams, away_teams))
+    return json.dumps({
+        "predictions": format_predictions(home_teams, away_teams, predictions),
+        **rmse_fields(metrics),
+        "model_id": model.metadata.get("model_id"),
+        "features_as_of": team_index.as_of,
     })
+
+def build_response(response_body, status_code=200):
+    return {
+        "isBase64Encoded": False,
+        "statusCode": status_code,
+        "headers": {"Content-Type": "application/json"},
+        "body": response_body,
+    }
+
+def next_games():
+    # Predictions of the current artifacts, precomputed by the snapshot stage
+    start = time.monotonic()
+    versions = source_versions()
+    response_body = cached_snapshot(versions)
+    if response_body is None and artifacts.versions_read_at < start:
+        # The snapshot may be newer than the versions reused, e.g. rewritten by
+        # the snapshot stage after a training
+        latest_versions = source_versions(max_age=0)
+        if latest_versions != versions:
+            versions = latest_versions
+            response_body = cached_snapshot(versions)
+    if response_body is None:
+        print("Predicting")
+        # Written through, so that the next requests are served from it
+        response_body = predict_games(versions)
+        write_snapshot(response_body, versions)
     print(response_body)
+    return response_body
+
+def handler(event, context):
+    try:
+        if event.get("httpMethod") == "POST":
+            response_body = predict_matchups(event)
+        else:
+            response_body = next_games()
+    except BadRequest as error:
+        return build_response(json.dumps({"error": str(error)}), status_code=400)
+    except FileNotFoundError as error:
+        # Nothing to serve until the ETL and the training function publish it
+        print(error)
+        return build_response(
+            json.dumps({"error": f"Predictions unavailable: {error}"}), status_code=503
+        )
+    print(f"Artifact cache: {artifacts.stats()}")
 
     return build_response(response_body)
 
+def snapshot_handler(event, context):
+    """Snapshot stage, scheduled after the ETL and the training."""
+    versions = source_versions(max_age=0)
+    write_snapshot(predict_games(versions), versions)
+    return versions
+
 if __name__ == "__main__":
     if os.getenv("LOCAL_TEST"):
         handler({}, None)
-
@@ -6,8 +6,21 @@ from typing import List
 @dataclass
 class AppConfig:
     S3_BUCKET: str = os.getenv("S3_BUCKET")
+    # Where the artifacts live: "s3" (S3_BUCKET) or "local" (LOCAL_STORAGE_DIR)
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "s3")
+    LOCAL_STORAGE_DIR: str = os.getenv("LOCAL_STORAGE_DIR")
     TRAIN_FILE_NAME: str = os.getenv("TRAIN_FILE_NAME")
+    # Pickled forest, kept to grow it in incremental mode
     ML_MODEL_FILE: str = os.getenv("ML_MODEL_FILE")
+    # Compact artifact of the forest, loaded by the predict function: "gzip"
+    # for S3, "none" to memory-map it from local storage
+    ML_FOREST_FILE: str = os.getenv("ML_FOREST_FILE", "best_model.forest")
+    FOREST_COMPRESSION: str = os.getenv("FOREST_COMPRESSION", "gzip")
+    # Evaluation of the published model, returned by the predict function
+    METRICS_FILE: str = os.getenv("METRICS_FILE", "metrics.json")
+    TRAINING_STATE_FILE: str = os.getenv("TRAINING_STATE_FILE", "training_state.json")
+    SEARCH_HISTORY_FILE: str = os.getenv("SEARCH_HISTORY_FILE", "search_history.json")
+    DATE_COLUMN: str = "home_date"
     FEATURES: List[str] = field(
         default_factory=lambda: [
             "home_avg_last_5_team_score",
@@ -21,6 +34,49 @@ class AppConfig:
         ]
     )
     N_CALLS_OPTIMIZATION: int = 20
+    CV_SPLITS: int = 5
+    # "full": search and rebuild the forest on every run. "incremental": grow
+    # the previous forest with trees fitted on the recent games, and only
+    # rebuild it when one of the thresholds below is crossed
+    TRAIN_MODE: str = os.getenv("TRAIN_MODE", "full")
+    # Rebuild when the RMSE on the new games exceeds the holdout RMSE of the
+    # last rebuild by this ratio...
+    ERROR_THRESHOLD: float = float(os.getenv("ERROR_THRESHOLD", 0.15))
+    # ... or when a feature mean moves by this many standard deviations
+    DRIFT_THRESHOLD: float = float(os.getenv("DRIFT_THRESHOLD", 0.5))
+    # New games needed before the checks are trusted; fewer are left for the
+    # next run
+    MIN_NEW_ROWS: int = int(os.getenv("MIN_NEW_ROWS", 50))
+    WARM_START_TREES: int = int(os.getenv("WARM_START_TREES", 50))
+    # Most recent games the added trees are fitted on
+    RECENT_ROWS: int = int(os.getenv("RECENT_ROWS", 2000))
+    # Rebuild once the forest would grow past this many trees
+    MAX_TREES: int = int(os.getenv("MAX_TREES", 2000))
+    # Hyperparameter search: "serial" (gp_minimize, one point at a time),
+    # "parallel" (batches of SEARCH_BATCH_SIZE points evaluated concurrently)
+    # or "halving" (successive halving over trees and folds)
+    SEARCH_MODE: str = os.getenv("SEARCH_MODE", "serial")
+    SEARCH_BATCH_SIZE: int = int(os.getenv("SEARCH_BATCH_SIZE", 4))
+    # Evaluations kept in the search history, which seeds the next searches
+    SEARCH_HISTORY_SIZE: int = 200
+    # Best stale evaluations (of other data) scored again on the current data
+    RESCORE_POINTS: int = int(os.getenv("RESCORE_POINTS", 3))
+    # n_calls once the history provides MIN_SEED_POINTS seeds
+    SEEDED_N_CALLS: int = int(os.getenv("SEEDED_N_CALLS", 8))
+    MIN_SEED_POINTS: int = 10
+    # Training budget of the halving search, in full evaluations (all the
+    # trees on all the folds); the number of candidates is derived from it
+    SEARCH_BUDGET: float = float(os.getenv("SEARCH_BUDGET", 20))
+    # Each rung keeps 1/HALVING_ETA of the candidates and gives them
+    # HALVING_ETA times the trees, the last rung trains them fully
+    HALVING_ETA: int = 3
+    HALVING_RUNGS: int = 3
+    HALVING_MIN_TREES: int = 10
+    # joblib backend of the parallel search. Process pools ("loky") need
+    # /dev/shm, which Lambda lacks; forests release the GIL while fitting
+    SEARCH_BACKEND: str = os.getenv("SEARCH_BACKEND", "threading")
+    # Cores shared by the search workers and the trees each of them builds
+    CORE_BUDGET: int = int(os.getenv("CORE_BUDGET", os.cpu_count() or 1))
     TARGET: List[str] = field(
         default_factory=lambda: ["home_team_score", "away_team_score"]
     )
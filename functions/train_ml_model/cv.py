@@ -0,0 +1,116 @@
+"""Cross-validation engine of the hyperparameter search: the TimeSeriesSplit
+folds of a training run as NumPy matrices built once, and a memo of the scores
+of every parameter set already fitted on them."""
+import hashlib
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_squared_error
+from sklearn.model_selection import TimeSeriesSplit
+
+from config import config
+
+
+class Fold(NamedTuple):
+    X_train: np.ndarray
+    y_train: np.ndarray
+    X_test: np.ndarray
+    y_test: np.ndarray
+    # Identifies the fold's rows, and so the scores fitted on them
+    fingerprint: str
+
+
+def build_folds(X, y, n_splits=config.CV_SPLITS) -> List[Fold]:
+    """The folds as contiguous arrays: float32 features, the dtype the trees
+    split on, so fits don't convert them again, and float64 targets.
+
+    TimeSeriesSplit trains on a prefix of the rows and tests on the next ones,
+    so every fold is made of views of the same two matrices."""
+    features = np.ascontiguousarray(X.to_numpy(dtype=np.float32))
+    targets = np.ascontiguousarray(y.to_numpy(dtype=np.float64))
+
+    folds = []
+    for train, test in TimeSeriesSplit(n_splits=n_splits).split(features):
+        end, stop = train[-1] + 1, test[-1] + 1
+        hasher = hashlib.sha256(f"{end}:{stop}".encode())
+        for array in (features[:stop], targets[:stop]):
+            hasher.update(str(array.shape).encode())
+            hasher.update(array.data)
+        folds.append(
+            Fold(
+                features[:end],
+                targets[:end],
+                features[end:stop],
+                targets[end:stop],
+                hasher.hexdigest(),
+            )
+        )
+    return folds
+
+
+class FoldScoreMemo:
+    """Scores of the (parameters, fold) pairs already fitted, for the life of
+    the process. Keys hold the fold fingerprint, so new data never hits."""
+
+    def __init__(self) -> None:
+        self.scores: Dict[Tuple, float] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(params: dict, fold: Fold) -> Tuple:
+        return tuple(sorted(params.items())), fold.fingerprint
+
+    def reset_stats(self) -> None:
+        self.hits = self.misses = 0
+
+    def stats(self) -> str:
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return f"{self.hits} hits, {self.misses} misses ({hit_rate:.0%} hit rate)"
+
+
+fold_scores = FoldScoreMemo()
+
+
+def split_cores(n_tasks, core_budget):
+    """Splits the core budget between concurrent tasks and the trees each task
+    builds, so that workers x tree jobs never exceeds it."""
+    workers = max(1, min(n_tasks, core_budget))
+    return workers, max(1, core_budget // workers)
+
+
+def fold_score(params, fold, n_jobs):
+    model = RandomForestRegressor(**params, random_state=0, n_jobs=n_jobs)
+    model.fit(fold.X_train, fold.y_train)
+    return mean_squared_error(fold.y_test, model.predict(fold.X_test))
+
+
+def score_candidates(candidates, folds):
+    """Mean MSE over `folds` of each parameter set. Pairs missing from the memo
+    are fitted concurrently, each one once."""
+    keys = [fold_scores.key(params, fold) for params in candidates for fold in folds]
+    pending = {}
+    for params in candidates:
+        for fold in folds:
+            key = fold_scores.key(params, fold)
+            if key not in fold_scores.scores:
+                pending.setdefault(key, (params, fold))
+    fold_scores.misses += len(pending)
+    fold_scores.hits += len(keys) - len(pending)
+
+    if pending:
+        workers, tree_jobs = split_cores(len(pending), config.CORE_BUDGET)
+        scores = Parallel(n_jobs=workers, backend=config.SEARCH_BACKEND)(
+            delayed(fold_score)(params, fold, tree_jobs)
+            for params, fold in pending.values()
+        )
+        fold_scores.scores.update(zip(pending, scores))
+
+    scores = [fold_scores.scores[key] for key in keys]
+    return [
+        float(np.mean(scores[i : i + len(folds)]))
+        for i in range(0, len(scores), len(folds))
+    ]
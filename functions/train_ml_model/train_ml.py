@@ -1,27 +1,42 @@
+import gzip
+import hashlib
+import json
 import os
 import pickle
-from io import StringIO
+import time
+import uuid
 
-import boto3
 import numpy as np
 import pandas as pd
 from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import TimeSeriesSplit, cross_val_score
-from skopt import gp_minimize
-from skopt.space import Integer
+from sklearn.metrics import mean_squared_error
+from skopt import Optimizer, gp_minimize
+from skopt.space import Integer, Space
 
+from common.datasets import read_dataframe
+from common.forest import serialize_forest
+from common.storage import create_storage
 from config import config
+from cv import build_folds, fold_scores, score_candidates
 
-s3_client = boto3.client("s3")
+METRICS_FORMAT_VERSION = 2
+# Floor of the standard deviations the feature drift is measured in
+DRIFT_MIN_STD = 1e-6
 
+_storage = None
 
-def read_data_from_s3(bucket, file_name):
-    csv_obj = s3_client.get_object(Bucket=bucket, Key=file_name)
-    body = csv_obj["Body"]
-    csv_string = body.read().decode("utf-8")
 
-    df = pd.read_csv(StringIO(csv_string))
-    return df
+def get_storage():
+    global _storage
+    if _storage is None:
+        _storage = create_storage(
+            config.STORAGE_BACKEND, bucket=config.S3_BUCKET, root=config.LOCAL_STORAGE_DIR
+        )
+    return _storage
+
+
+def read_data(file_name, columns=None):
+    return read_dataframe(get_storage(), file_name, columns)
 
 
 def train_model(X_train, y_train, params={}):
@@ -46,80 +61,515 @@ def time_series_split(
     return X_train, X_test, y_train, y_test
 
 
+SEARCH_SPACE = [
+    Integer(100, 1000, name="n_estimators"),
+    Integer(5, 50, name="max_depth"),
+    Integer(2, 10, name="min_samples_split"),
+    Integer(1, 10, name="min_samples_leaf"),
+]
+
+
+def point_to_params(point):
+    return {dimension.name: int(value) for dimension, value in zip(SEARCH_SPACE, point)}
+
+
+def params_to_point(params):
+    return [params[dimension.name] for dimension in SEARCH_SPACE]
+
+
 def optimize_model(X, y, n_calls=config.N_CALLS_OPTIMIZATION):
-    def objective(params):
-        model = RandomForestRegressor(
-            n_estimators=params[0],
-            max_depth=params[1],
-            min_samples_split=params[2],
-            min_samples_leaf=params[3],
-            random_state=0,
+    """Searches the forest hyperparameters, seeded with the evaluations of the
+    previous runs, and adds this run's evaluations to the search history."""
+    fingerprint = data_fingerprint(X, y)
+    folds = build_folds(X, y)
+    fold_scores.reset_stats()
+    history = read_search_history()
+    x0, y0, history = seed_points(folds, fingerprint, history)
+    if len(x0) >= config.MIN_SEED_POINTS:
+        n_calls = min(n_calls, config.SEEDED_N_CALLS)
+
+    if config.SEARCH_MODE == "parallel":
+        best_params, evaluations = optimize_model_parallel(folds, n_calls, x0=x0, y0=y0)
+    elif config.SEARCH_MODE == "halving":
+        best_params, evaluations = optimize_model_halving(folds, x0=x0, y0=y0)
+    else:
+        best_params, evaluations = optimize_model_serial(folds, n_calls, x0=x0, y0=y0)
+    print(f"Fold score cache: {fold_scores.stats()}")
+
+    write_search_history(
+        history + [history_entry(params, loss, fingerprint) for params, loss in evaluations]
+    )
+    return best_params
+
+
+def optimize_model_serial(folds, n_calls=config.N_CALLS_OPTIMIZATION, x0=None, y0=None):
+    """gp_minimize, one point at a time. Returns the best parameters and the
+    (parameters, loss) pairs it evaluated."""
+
+    def objective(point):
+        return score_candidates([point_to_params(point)], folds)[0]
+
+    x0 = x0 or []
+    result = gp_minimize(
+        objective,
+        SEARCH_SPACE,
+        n_calls=n_calls,
+        # The seeds count as initial points
+        n_initial_points=max(0, 10 - len(x0)),
+        x0=x0 or None,
+        y0=y0 or None,
+        random_state=0,
+    )
+
+    evaluations = [
+        (point_to_params(point), float(loss))
+        for point, loss in zip(result.x_iters[len(x0) :], result.func_vals[len(x0) :])
+    ]
+    return point_to_params(result.x), evaluations
+
+
+def data_fingerprint(X, y):
+    """Hash of the data and CV setup the losses of the search are valid for."""
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps([list(X.columns), list(y.columns), config.CV_SPLITS]).encode())
+    for frame in (X, y):
+        hasher.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return hasher.hexdigest()
+
+
+def history_entry(params, loss, fingerprint):
+    return {
+        "params": params,
+        "loss": loss,
+        "fingerprint": fingerprint,
+        "evaluated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def read_search_history():
+    """Evaluations of the previous searches: none on the first run, or when
+    the stored history can't be read."""
+    stored = get_storage().get(config.SEARCH_HISTORY_FILE)
+    if stored is None:
+        return []
+    try:
+        return json.loads(stored.read())["evaluations"]
+    except (ValueError, KeyError, TypeError) as error:
+        print(f"Ignoring {config.SEARCH_HISTORY_FILE}: {error!r}")
+        return []
+
+
+def write_search_history(history):
+    history = history[-config.SEARCH_HISTORY_SIZE :]
+    get_storage().put(
+        config.SEARCH_HISTORY_FILE,
+        json.dumps({"evaluations": history}, indent=2).encode("utf-8"),
+        content_type="application/json",
+    )
+
+
+def seed_points(folds, fingerprint, history):
+    """x0/y0 for the search from the stored evaluations, and the history to
+    keep.
+
+    Losses of the current data are used as they are. Of the stale ones, the
+    best RESCORE_POINTS are scored again on the current data, and the others
+    are discounted by the median ratio of the new to the old losses."""
+    space = Space(SEARCH_SPACE)
+    latest = {}
+    for entry in history:
+        # Points of an older search space can't seed this one
+        if params_to_point(entry["params"]) in space:
+            latest[tuple(params_to_point(entry["params"]))] = entry
+    history = list(latest.values())
+
+    current = [entry for entry in history if entry["fingerprint"] == fingerprint]
+    stale = sorted(
+        (entry for entry in history if entry["fingerprint"] != fingerprint),
+        key=lambda entry: entry["loss"],
+    )
+    rescore, discount = stale[: config.RESCORE_POINTS], stale[config.RESCORE_POINTS :]
+    ratio = 1.0
+    if rescore:
+        losses = score_candidates([entry["params"] for entry in rescore], folds)
+        ratio = float(
+            np.median([new / entry["loss"] for entry, new in zip(rescore, losses)])
         )
-        time_series_cv = TimeSeriesSplit(n_splits=5)
-        return -np.mean(
-            cross_val_score(
-                model, X, y, cv=time_series_cv, scoring="neg_mean_squared_error"
+        current += [
+            history_entry(entry["params"], loss, fingerprint)
+            for entry, loss in zip(rescore, losses)
+        ]
+    print(
+        f"Search history: {len(current)} current points ({len(rescore)} rescored), "
+        f"{len(discount)} stale points discounted by {ratio:.3f}"
+    )
+
+    seeds = [(entry, entry["loss"]) for entry in current] + [
+        (entry, entry["loss"] * ratio) for entry in discount
+    ]
+    x0 = [params_to_point(entry["params"]) for entry, _ in seeds]
+    y0 = [loss for _, loss in seeds]
+    return x0, y0, discount + current
+
+
+def optimize_model_parallel(
+    folds,
+    n_calls=config.N_CALLS_OPTIMIZATION,
+    batch_size=config.SEARCH_BATCH_SIZE,
+    x0=None,
+    y0=None,
+):
+    """Bayesian search proposing `batch_size` points at a time (constant liar),
+    with every (point, CV fold) pair of a batch evaluated concurrently.
+    Returns the best parameters and the (parameters, loss) pairs evaluated."""
+    optimizer = Optimizer(SEARCH_SPACE, base_estimator="GP", random_state=0)
+    if x0:
+        optimizer.tell(x0, y0)
+
+    evaluations = []
+    while len(evaluations) < n_calls:
+        points = optimizer.ask(n_points=min(batch_size, n_calls - len(evaluations)))
+        start = time.perf_counter()
+        candidates = [point_to_params(point) for point in points]
+        losses = score_candidates(candidates, folds)
+        result = optimizer.tell(points, losses)
+        evaluations += zip(candidates, losses)
+        print(
+            f"Evaluated {len(evaluations)}/{n_calls} points in "
+            f"{time.perf_counter() - start:.1f}s, best MSE {result.fun:.2f}"
+        )
+
+    # The best point told, seeds included: none were evaluated if n_calls is 0
+    if not optimizer.yi:
+        raise ValueError("Nothing to choose from: no calls and no seed points")
+    best = int(np.argmin(optimizer.yi))
+    return point_to_params(optimizer.Xi[best]), evaluations
+
+
+def halving_rungs(n_candidates, n_folds):
+    """(candidates, tree fraction, folds) of each rung of the halving search."""
+    eta, last = config.HALVING_ETA, config.HALVING_RUNGS - 1
+    rungs = []
+    for rung in range(config.HALVING_RUNGS):
+        fraction = float(eta) ** (rung - last)
+        rungs.append(
+            (
+                max(1, n_candidates // eta**rung),
+                fraction,
+                max(1, int(np.ceil(n_folds * fraction))),
             )
         )
+    return rungs
+
 
-    search_space = [
-        Integer(100, 1000, name="n_estimators"),
-        Integer(5, 50, name="max_depth"),
-        Integer(2, 10, name="min_samples_split"),
-        Integer(1, 10, name="min_samples_leaf"),
+def fit_cost(n_estimators, folds):
+    """Compute of fitting `n_estimators` trees on each of `folds`, in tree x
+    training row units."""
+    return n_estimators * sum(len(fold.X_train) for fold in folds)
+
+
+def rung_trees(n_estimators, fraction):
+    return max(config.HALVING_MIN_TREES, int(n_estimators * fraction))
+
+
+def optimize_model_halving(folds, budget=config.SEARCH_BUDGET, x0=None, y0=None):
+    """Successive halving: random candidates are first scored with a fraction
+    of their trees on the most recent folds, and only the best 1/eta of each
+    rung move on to more trees and folds. The last rung is a full evaluation.
+
+    `budget` is in full evaluations of an average candidate. As many candidates
+    are drawn as the rungs are sure to train within it, whichever candidates
+    survive. The best seed points, up to the number of candidates the first
+    rung keeps, replace random ones."""
+    low, high = SEARCH_SPACE[0].bounds
+    full_evaluation = fit_cost((low + high) / 2, folds)
+    allowed = budget * full_evaluation
+
+    def planned_cost(candidates):
+        """Cost of the rungs if each one keeps the candidates with the most trees."""
+        cost = 0
+        for n, fraction, n_folds in halving_rungs(len(candidates), len(folds)):
+            trees = sorted(
+                (rung_trees(c["n_estimators"], fraction) for c in candidates),
+                reverse=True,
+            )
+            cost += sum(fit_cost(n_trees, folds[-n_folds:]) for n_trees in trees[:n])
+        return cost
+
+    # More random points than the budget could ever train, from which the
+    # longest prefix within it is found by bisection
+    _, first_fraction, first_folds = halving_rungs(1, len(folds))[0]
+    cheapest = fit_cost(rung_trees(low, first_fraction), folds[-first_folds:])
+    pool = [
+        point_to_params(point)
+        for point in Space(SEARCH_SPACE).rvs(
+            n_samples=int(allowed // cheapest) + 1, random_state=0
+        )
     ]
+    if planned_cost(pool[:1]) > allowed:
+        raise ValueError(
+            f"A search budget of {budget:g} full evaluations can't train a "
+            f"single candidate through the {config.HALVING_RUNGS} rungs"
+        )
+    lo, hi = 1, len(pool)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if planned_cost(pool[:mid]) <= allowed:
+            lo = mid
+        else:
+            hi = mid - 1
+    candidates = pool[:lo]
+
+    rungs = halving_rungs(len(candidates), len(folds))
+    # Seeds are scored on the first rung like the others, never promoted
+    n_seeds = rungs[1][0] if len(rungs) > 1 else 0
+    seeds = [point_to_params(point) for _, point in sorted(zip(y0 or [], x0 or []))]
+    seeds = seeds[:n_seeds]
+    random_candidates = [c for c in candidates if c not in seeds]
+    candidates = seeds + random_candidates[: len(candidates) - len(seeds)]
+    # Seeds may have more trees than the random candidates they replace
+    while planned_cost(candidates) > allowed:
+        candidates.pop()
+    candidates = candidates or pool[:1]
+    n_candidates = len(candidates)
+    rungs = halving_rungs(n_candidates, len(folds))
+    full_search_cost = sum(fit_cost(c["n_estimators"], folds) for c in candidates)
+    # The best candidate of the last rung is the result
+    survivors = [n for n, _, _ in rungs[1:]] + [1]
+    cost = 0
+    for rung, ((_, fraction, n_folds), keep) in enumerate(zip(rungs, survivors)):
+        rung_folds = folds[-n_folds:]
+        rung_params = [
+            {
+                **params,
+                "n_estimators": rung_trees(params["n_estimators"], fraction),
+            }
+            for params in candidates
+        ]
+        start = time.perf_counter()
+        losses = score_candidates(rung_params, rung_folds)
+        cost += sum(fit_cost(p["n_estimators"], rung_folds) for p in rung_params)
+        ranking = np.argsort(losses, kind="stable")
+        print(
+            f"Rung {rung}: {len(candidates)} candidates, {fraction:.0%} of the "
+            f"trees on {n_folds} folds in {time.perf_counter() - start:.1f}s, "
+            f"best MSE {losses[ranking[0]]:.2f}"
+        )
+        # Only the last rung's losses are full evaluations: all of them are
+        # kept, losers included, for the history that seeds later searches
+        evaluations = [(rung_params[i], losses[i]) for i in ranking]
+        candidates = [candidates[i] for i in ranking[:keep]]
 
-    result = gp_minimize(objective, search_space, n_calls=n_calls, random_state=0)
+    print(
+        f"Halving search used {cost / full_evaluation:.1f} of {budget:g} full "
+        f"evaluations; evaluating all {n_candidates} candidates fully would have "
+        f"used {full_search_cost / full_evaluation:.1f} "
+        f"({1 - cost / full_search_cost:.0%} saved)"
+    )
+    return candidates[0], evaluations
 
-    best_params = {
-        "n_estimators": result.x[0],
-        "max_depth": result.x[1],
-        "min_samples_split": result.x[2],
-        "min_samples_leaf": result.x[3],
-    }
 
-    return best_params
+def upload_model(model, model_key):
+    # Pickled in memory and uploaded from the buffer, in parts when large
+    get_storage().put(model_key, pickle.dumps(model))
 
 
-def get_base_path():
-    if os.getenv("LOCAL_TEST"):
-        # Running locally
-        return "."
-    else:
-        # Running in AWS Lambda
-        return "/tmp"
+def upload_forest(model, forest_key, model_id):
+    """Uploads the compact artifact of the forest, which the predict function
+    loads instead of the pickle."""
+    body = serialize_forest(
+        model, config.FEATURES, config.TARGET, metadata={"model_id": model_id}
+    )
+    content_encoding = None
+    if config.FOREST_COMPRESSION == "gzip":
+        body = gzip.compress(body)
+        content_encoding = "gzip"
+    get_storage().put(
+        forest_key,
+        body,
+        content_type="application/octet-stream",
+        content_encoding=content_encoding,
+    )
 
 
-def upload_model_to_s3(model, bucket, model_key):
-    # Serialize the model
-    model_data = pickle.dumps(model)
+def load_model(model_key):
+    stored = get_storage().get(model_key)
+    if stored is None:
+        return None
+    return pickle.loads(stored.body)
 
-    # Determine the base path
-    base_path = get_base_path()
-    temp_path = os.path.join(base_path, model_key)
 
-    # Write to a file
-    with open(temp_path, "wb") as file:
-        file.write(model_data)
+def serving_artifacts_published():
+    storage = get_storage()
+    return all(
+        storage.head(key) is not None
+        for key in (config.ML_FOREST_FILE, config.METRICS_FILE)
+    )
 
-    # Upload the file to S3
-    with open(temp_path, "rb") as file:
-        s3_client.upload_fileobj(file, bucket, model_key)
 
+def read_training_state():
+    stored = get_storage().get(config.TRAINING_STATE_FILE)
+    if stored is None:
+        return None
+    return json.loads(stored.read())
 
-def handler(event, context):
-    # Read data from S3
-    df = read_data_from_s3(config.S3_BUCKET, config.TRAIN_FILE_NAME)
+
+def write_training_state(state):
+    get_storage().put(
+        config.TRAINING_STATE_FILE,
+        json.dumps(state, indent=2).encode("utf-8"),
+        content_type="application/json",
+    )
+
+
+def write_metrics(model, state):
+    """Publishes the evaluation of the model, which the predict function
+    returns instead of evaluating it on every request."""
+    metrics = {
+        "format_version": METRICS_FORMAT_VERSION,
+        "model_id": state["model_id"],
+        # Holdout RMSE of the total points, with the parameters of the last
+        # rebuild: the trees added by incremental runs since aren't evaluated
+        "rebuild_holdout_rmse": state["holdout_rmse"],
+        "rebuild_model_id": state.get("rebuild_model_id"),
+        # Before the trees of an incremental run were added
+        "new_games_rmse": state.get("new_games_rmse"),
+        "n_estimators": model.n_estimators,
+        "params": state["params"],
+        "trained_until": state["trained_until"],
+        "trained_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    get_storage().put(
+        config.METRICS_FILE,
+        json.dumps(metrics, indent=2).encode("utf-8"),
+        content_type="application/json",
+    )
+
+
+def total_points_rmse(model, X, y):
+    """RMSE of the predicted total points of each game."""
+    predictions = model.predict(X).sum(axis=1)
+    return float(np.sqrt(mean_squared_error(y.sum(axis=1), predictions)))
+
+
+def full_retrain(df):
+    """Searches the hyperparameters and builds a new forest on the whole
+    history. Returns the model and its training state."""
     # Split data into training and testing sets
     X_train, X_test, y_train, y_test = time_series_split(df)
     # Optimize model
     optimized_params = optimize_model(X_train, y_train)
-    # Train model with optimized parameters
+    params = {**optimized_params, "n_jobs": config.CORE_BUDGET}
+    # Holdout error of the parameters, the reference of the incremental checks
+    holdout_rmse = total_points_rmse(
+        train_model(X_train, y_train, params=params), X_test, y_test
+    )
+    # Train model with optimized parameters, building the trees on every core
     X = df[config.FEATURES]
     y = df[config.TARGET]
-    model = train_model(X, y, params=optimized_params)
-    # Upload model to S3
-    upload_model_to_s3(model, config.S3_BUCKET, config.ML_MODEL_FILE)
+    model = train_model(X, y, params=params)
+
+    # Ties the metrics to the forest they describe
+    model_id = uuid.uuid4().hex
+    state = {
+        "model_id": model_id,
+        "rebuild_model_id": model_id,
+        "params": optimized_params,
+        "holdout_rmse": holdout_rmse,
+        "feature_means": X.mean().tolist(),
+        "feature_stds": X.std().tolist(),
+        "rebuilt_at": df[config.DATE_COLUMN].max().isoformat(),
+    }
+    return model, state
+
+
+def rebuild_reason(model, state, new_df, rmse):
+    """Why the forest must be rebuilt rather than grown, None if it can grow.
+    `rmse` is the error of the model on the new games."""
+    if model.n_estimators + config.WARM_START_TREES > config.MAX_TREES:
+        return f"forest would exceed {config.MAX_TREES} trees"
+
+    if rmse > state["holdout_rmse"] * (1 + config.ERROR_THRESHOLD):
+        return (
+            f"RMSE {rmse:.2f} on {len(new_df)} new games, "
+            f"{state['holdout_rmse']:.2f} at the last rebuild"
+        )
+
+    shift = np.abs(new_df[config.FEATURES].mean().to_numpy() - state["feature_means"])
+    # A feature constant at the rebuild drifts as soon as it moves at all
+    stds = np.fmax(np.array(state["feature_stds"], dtype=float), DRIFT_MIN_STD)
+    drift = float(np.max(shift / stds))
+    if drift > config.DRIFT_THRESHOLD:
+        return f"feature means moved by {drift:.2f} standard deviations"
+    return None
+
+
+def incremental_retrain(df, model, state):
+    """Grows the previous forest with trees fitted on the recent games, unless
+    its error or the features drifted. Returns the model and its training
+    state, None when there are too few new games to go on."""
+    last_date = pd.Timestamp(state["trained_until"])
+    new_df = df[df[config.DATE_COLUMN] > last_date]
+    if len(new_df) < config.MIN_NEW_ROWS:
+        print(f"{len(new_df)} new games since {last_date}, waiting for more")
+        return None
+
+    if list(model.feature_names_in_) != config.FEATURES:
+        print("Rebuilding the model: features changed")
+        return full_retrain(df)
+    rmse = total_points_rmse(model, new_df[config.FEATURES], new_df[config.TARGET])
+    reason = rebuild_reason(model, state, new_df, rmse)
+    if reason:
+        print(f"Rebuilding the model: {reason}")
+        return full_retrain(df)
+
+    recent = df.tail(config.RECENT_ROWS)
+    n_estimators = model.n_estimators + config.WARM_START_TREES
+    model.set_params(
+        warm_start=True, n_estimators=n_estimators, n_jobs=config.CORE_BUDGET
+    )
+    model.fit(recent[config.FEATURES], recent[config.TARGET])
+    print(
+        f"Added {config.WARM_START_TREES} trees fitted on the last {len(recent)} "
+        f"games ({len(new_df)} new), {n_estimators} trees in total"
+    )
+    return model, {**state, "model_id": uuid.uuid4().hex, "new_games_rmse": rmse}
+
+
+def handler(event, context):
+    # Read data from the artifacts storage
+    df = read_data(
+        config.TRAIN_FILE_NAME,
+        columns=[config.DATE_COLUMN] + config.FEATURES + config.TARGET,
+    )
+    df[config.DATE_COLUMN] = pd.to_datetime(df[config.DATE_COLUMN], utc=True)
+
+    model = state = None
+    if config.TRAIN_MODE == "incremental":
+        state = read_training_state()
+        model = load_model(config.ML_MODEL_FILE) if state else None
+        if model is None:
+            print("No previous model or training state, fitting a new model")
+        elif not serving_artifacts_published():
+            # A run that failed midway: fitting again publishes them all
+            print("The forest or the metrics are missing, fitting a new model")
+            model = None
+
+    if model is None:
+        result = full_retrain(df)
+    else:
+        result = incremental_retrain(df, model, state)
+    if result is None:
+        return
+
+    model, state = result
+    state = {**state, "trained_until": df[config.DATE_COLUMN].max().isoformat()}
+    # Upload model, its compact artifact, its metrics and its training state
+    # to the artifacts storage
+    upload_model(model, config.ML_MODEL_FILE)
+    upload_forest(model, config.ML_FOREST_FILE, state["model_id"])
+    write_metrics(model, state)
+    write_training_state(state)
 
 
 if __name__ == "__main__":
@@ -69,6 +69,10 @@ class CodeBuildStack(Stack):
             "PREDICT_LAMBDA_FUNCTION_NAME": codebuild.BuildEnvironmentVariable(
                 value=lambda_functions["predict"].function_name
             ),
+            # Snapshot stage, from the PREDICT image
+            "SNAPSHOT_LAMBDA_FUNCTION_NAME": codebuild.BuildEnvironmentVariable(
+                value=lambda_functions["snapshot"].function_name
+            ),
         }
         build_project = codebuild.Project(
             self,
@@ -36,7 +36,14 @@ class ETLStack(Stack):
         lambda_role.add_to_policy(
             iam.PolicyStatement(
                 effect=iam.Effect.ALLOW,
-                actions=["s3:GetObject", "s3:PutObject"],
+                # ListBucket lets a missing extract watermark surface as
+                # NoSuchKey instead of AccessDenied
+                actions=[
+                    "s3:GetObject",
+                    "s3:PutObject",
+                    "s3:DeleteObject",
+                    "s3:ListBucket",
+                ],
                 resources=[s3_bucket.bucket_arn, s3_bucket.arn_for_objects("*")],
             )
         )
@@ -57,7 +64,16 @@ class ETLStack(Stack):
                 file="etl.dockerfile",
             ),
             role=lambda_role,
-            environment={"S3_BUCKET": s3_bucket.bucket_name},
+            environment={
+                "S3_BUCKET": s3_bucket.bucket_name,
+                # /tmp doesn't survive between daily runs, the bucket does
+                "RESPONSE_CACHE": "s3",
+                "ROLLING_MODE": "incremental",
+                "PAIRING_MODE": "interleaved",
+                "ARTIFACT_FORMAT": "parquet",
+                # Seasons are fetched concurrently; no /dev/shm for processes
+                "FLOW_EXECUTOR": "threads",
+            },
             memory_size=1024,
             timeout=Duration.minutes(5),
         )
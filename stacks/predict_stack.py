@@ -2,6 +2,8 @@ import aws_cdk as cdk
 from aws_cdk import App, Aws, CfnOutput, Duration, Stack
 from aws_cdk import aws_apigateway as apigateway
 from aws_cdk import aws_ecr as ecr
+from aws_cdk import aws_events as events
+from aws_cdk import aws_events_targets as targets
 from aws_cdk import aws_iam as iam
 from aws_cdk import aws_lambda as _lambda
 from aws_cdk import aws_logs as logs
@@ -24,6 +26,10 @@ class PredictStack(Stack):
         )
         self.api = self.create_api_gateway(self.predict_lambda_function)
         self.add_lambda_logging(self.predict_lambda_function)
+        self.snapshot_lambda_function = self.create_snapshot_lambda_function(
+            s3_bucket=s3_bucket, role=self.predict_lambda_function.role
+        )
+        self.schedule_lambda_function(self.snapshot_lambda_function)
 
         # Outputs
         self.create_outputs(self.predict_lambda_function, self.api)
@@ -44,6 +50,14 @@ class PredictStack(Stack):
                 resources=[s3_bucket.bucket_arn, s3_bucket.arn_for_objects("*")],
             )
         )
+        # Lets a HEAD on a missing snapshot return 404 rather than 403
+        lambda_role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["s3:ListBucket"],
+                resources=[s3_bucket.bucket_arn],
+            )
+        )
 
         lambda_function = _lambda.DockerImageFunction(
             self,
@@ -53,12 +67,7 @@ class PredictStack(Stack):
                 file="predict.dockerfile",
             ),
             role=lambda_role,
-            environment={
-                "S3_BUCKET": s3_bucket.bucket_name,
-                "PREDICT_FILE_NAME": "to_predict.csv",
-                "TRAIN_FILE_NAME": "to_train.csv",
-                "ML_MODEL_FILE": "best_model.pkl",
-            },
+            environment=self.lambda_environment(s3_bucket),
             memory_size=512,
             timeout=Duration.minutes(10),
         )
@@ -79,6 +88,51 @@ class PredictStack(Stack):
 
         return lambda_function
 
+    def lambda_environment(self, s3_bucket: s3.Bucket):
+        return {
+            "S3_BUCKET": s3_bucket.bucket_name,
+            "PREDICT_FILE_NAME": "to_predict.parquet",
+            "ML_FOREST_FILE": "best_model.forest",
+            "METRICS_FILE": "metrics.json",
+            "SNAPSHOT_FILE": "predictions.json",
+            "TEAM_INDEX_FILE": "team_index.json",
+        }
+
+    def create_snapshot_lambda_function(self, s3_bucket: s3.Bucket, role: iam.IRole):
+        # Same image, role and settings as the API function, running the
+        # snapshot stage
+        return _lambda.DockerImageFunction(
+            self,
+            "Snapshot_lambda_function",
+            code=_lambda.DockerImageCode.from_image_asset(
+                directory=".",
+                file="predict.dockerfile",
+                cmd=["predict.snapshot_handler"],
+            ),
+            role=role,
+            environment=self.lambda_environment(s3_bucket),
+            memory_size=512,
+            timeout=Duration.minutes(10),
+        )
+
+    def schedule_lambda_function(self, lambda_function: _lambda.Function):
+        # Daily, a quarter of an hour after the ETL (11:00) and the training
+        # (12:00), both shorter than that
+        schedule = events.Schedule.cron(
+            minute="15",
+            hour="11-12",
+            day="*",
+            month="*",
+            year="*",
+        )
+
+        events.Rule(
+            self,
+            "SnapshotRule",
+            schedule=schedule,
+            targets=[targets.LambdaFunction(lambda_function)],
+        )
+
     def add_lambda_logging(self, lambda_function):
         # Create a log group for the Lambda function
         lambda_log_group = logs.LogGroup(
@@ -105,6 +159,13 @@ class PredictStack(Stack):
             "GET",
             apigateway.LambdaIntegration(predict_lambda_function),
         )
+
+        # 'predict/batch' scores the matchups POSTed in the request body
+        batch_resource = predict_resource.add_resource("batch")
+        batch_resource.add_method(
+            "POST",
+            apigateway.LambdaIntegration(predict_lambda_function),
+        )
         return api
 
     def create_outputs(self, predict_lambda_function, api):
@@ -35,11 +35,13 @@ class TrainMLStack(Stack):
             "MLLambdaExecutionRole",
             assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
         )
-        # Grant necessary permissions to the Lambda role
+        # Grant necessary permissions to the Lambda role. ListBucket lets a
+        # missing training state or search history surface as NoSuchKey
+        # instead of AccessDenied
         lambda_role.add_to_policy(
             iam.PolicyStatement(
                 effect=iam.Effect.ALLOW,
-                actions=["s3:GetObject", "s3:PutObject"],
+                actions=["s3:GetObject", "s3:PutObject", "s3:ListBucket"],
                 resources=[s3_bucket.bucket_arn, s3_bucket.arn_for_objects("*")],
             )
         )
@@ -54,10 +56,16 @@ class TrainMLStack(Stack):
             role=lambda_role,
             environment={
                 "S3_BUCKET": s3_bucket.bucket_name,
-                "TRAIN_FILE_NAME": "to_train.csv",
+                "TRAIN_FILE_NAME": "to_train.parquet",
                 "ML_MODEL_FILE": "best_model.pkl",
+                "ML_FOREST_FILE": "best_model.forest",
+                "METRICS_FILE": "metrics.json",
+                "TRAIN_MODE": "incremental",
+                "SEARCH_MODE": "parallel",
+                "CORE_BUDGET": "2",
             },
-            memory_size=512,
+            # Lambda allocates vCPUs in proportion to memory: 2 at 3538 MB
+            memory_size=3538,
             timeout=Duration.minutes(10),
         )
 
@@ -73,10 +81,12 @@ class TrainMLStack(Stack):
         return lambda_function
 
     def schedule_lambda_function(self, lambda_function: _lambda.Function):
+        # Daily, after the ETL: incremental runs only grow the forest, and
+        # skip the day when there are too few new games
         schedule = events.Schedule.cron(
             minute="0",
-            hour="11",
-            day="10",
+            hour="12",
+            day="*",
             month="*",
             year="*",
         )
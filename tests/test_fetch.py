@@ -0,0 +1,82 @@
+"""PageFetcher against the local stand-in of the balldontlie API.
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "functions", "ETL"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "functions"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+import requests  # noqa: E402
+from fake_api import FakeAPI, make_games  # noqa: E402
+from scripts.cache import DiskStore, ResponseCache  # noqa: E402
+from scripts.fetch import PageFetcher  # noqa: E402
+
+
+def make_fetcher(api, **kwargs):
+    return PageFetcher(
+        base_url=api.url, requests_per_minute=60_000, backoff_seconds=0.001, **kwargs
+    )
+
+
+def ids(games):
+    return [game["id"] for game in games]
+
+
+class PageFetcherTest(unittest.TestCase):
+    def test_fetches_every_page_in_order(self):
+        games = make_games(95)
+        with FakeAPI(games) as api:
+            for workers in (1, 4):
+                api.requests = 0
+                fetched = make_fetcher(api, workers=workers).fetch_all({"per_page": 10})
+                self.assertEqual(ids(fetched), ids(games))
+                self.assertEqual(api.requests, 10)
+
+    def test_retries_server_errors(self):
+        games = make_games(30)
+        with FakeAPI(games, fail_first=3) as api:
+            fetched = make_fetcher(api, max_retries=3).fetch_all({"per_page": 10})
+            self.assertEqual(ids(fetched), ids(games))
+            self.assertEqual(api.failures, 3)
+            self.assertEqual(api.requests, 3 + 3)
+
+    def test_gives_up_after_max_retries(self):
+        with FakeAPI(make_games(30), fail_first=3) as api:
+            with self.assertRaises(requests.HTTPError):
+                make_fetcher(api, max_retries=2).fetch_all({"per_page": 10})
+            self.assertEqual(api.requests, 3)
+
+    def test_empty_listing(self):
+        with FakeAPI(make_games(30)) as api:
+            fetched = make_fetcher(api, workers=4).fetch_all(
+                {"start_date": "2030-01-01", "per_page": 10}
+            )
+            self.assertEqual(fetched, [])
+            self.assertEqual(api.requests, 1)
+
+    def test_cached_pages_are_keyed_by_total_count(self):
+        games = make_games(50)
+        with tempfile.TemporaryDirectory() as root, FakeAPI(games) as api:
+            cache = ResponseCache(DiskStore(root, max_bytes=2**20), ttl_seconds=60)
+            fetcher = make_fetcher(api, workers=2, cache=cache)
+            fetcher.fetch_all({"per_page": 10})
+
+            # Unchanged listing: only the first page is fetched again
+            api.requests = 0
+            self.assertEqual(ids(fetcher.fetch_all({"per_page": 10})), ids(games))
+            self.assertEqual(api.requests, 1)
+
+            # New games change total_count, so no cached page is served
+            games.extend(make_games(60)[50:])
+            api.requests = 0
+            self.assertEqual(ids(fetcher.fetch_all({"per_page": 10})), ids(games))
+            self.assertEqual(api.requests, 6)
+
+
+if __name__ == "__main__":
+    unittest.main()